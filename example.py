@@ -4,34 +4,44 @@
 Example for identification of single televid.
 """
 
+import argparse
 import logging
 
 import televid
 
-logging.basicConfig(level=logging.INFO)
 
-
-def main():
+def main(argv=None):
     """ The main function which is required for calling telvid.identify() since
     the multiprocessing requires importing main to be frozen to produce an
     executable. Some extra info can be found here: https://github.com/nipy/dipy/issues/399/
+
+    argv (list, optional): Defaults to None. The command-line arguments,
+        `sys.argv[1:]` if None.
     """
 
+    parser = argparse.ArgumentParser(description='Identify a single audio '
+                                     'file.')
+    parser.add_argument('filepath', help='the target audio file')
+    parser.add_argument('--threshold', type=float, default=1500)
+    parser.add_argument('--scan-step', type=int, default=4)
+    # NOTE: If running on Windows, multiproc may increase running time
+    # drastically.
+    parser.add_argument('--sequential', action='store_true',
+                        help='compare with the golden patterns one by one')
+    args = parser.parse_args(argv)
+
     # Load golden patterns first.
     golden_patterns = televid.Televid.load_golden_patterns()
 
-    # Set the target file path.
-    filepath = 'test_wav/T04.WAV'
-
-    televoice = televid.Televid(filepath, golden_patterns)
+    televoice = televid.Televid(args.filepath, golden_patterns)
 
-    # NOTE: If running on Windows, multiproc may increase running time
-    # drastically.
-    televoice.identify(threshold=1500, scan_step=4, multiproc=True)
+    televoice.identify(threshold=args.threshold, scan_step=args.scan_step,
+                       multiproc=not args.sequential)
 
     logging.getLogger(__name__).info('Result: %s', televoice.matched_pattern(True))
     logging.getLogger(__name__).info('Total time elapse: %f', televoice.identify_time)
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     main()
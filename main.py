@@ -3,26 +3,48 @@
 
 Run through all of the testing data by calling televid for best parameter
 testing.
+
+Run `python main.py --help` for the command-line options. It exits with 0 if
+every file is identified, 1 if any file fails, 2 on a usage error and 3 if no
+file matches the inputs.
 """
 
+import argparse
+import contextlib
 import csv
-import itertools
+import glob
 import logging
 import multiprocessing as mp
 import pathlib
 import pickle
 import platform
+import queue
+import sys
 import time
 
 import televid
+from televid import profiling
+from televid.classifier import CLASSIFIER_FILENAME, DiffsClassifier
+from televid.discovery import (discover, in_shard, parse_shard,
+                               relative_path)
+from televid.index import PatternIndex
+from televid.shm import share_patterns, transfer
+from televid.televid import JOIN_GRACE, remaining_time
+from televid.writers import (CsvResultWriter, JsonlDatasetWriter,
+                             NpzDatasetWriter, result_fields)
+
+# The exit status of `main()`.
+EXIT_OK, EXIT_FAILURES, EXIT_USAGE, EXIT_NO_INPUTS = 0, 1, 2, 3
 
-logging.basicConfig(level=logging.INFO)
+# The writer of each output format of `main()`.
+WRITERS = {'csv': CsvResultWriter, 'jsonl': JsonlDatasetWriter,
+           'npz': NpzDatasetWriter}
 
 
 class RunTelevid():
     """ Hold the state of multiple results of `Televid` instance. """
 
-    def __init__(self, folderpath, ext=('**/*.wav', '**/*.mp3')):
+    def __init__(self, folderpath, ext=('**/*.wav', '**/*.mp3'), shard=None):
         """ Initialize the folder path and extensions for files to test in
             `RunTelevid().run()`.
 
@@ -30,24 +52,52 @@ class RunTelevid():
             testing audio files.
         ext (tuple, optional): Defaults to ('*.wav', '*.mp3'). The extensions
             (file types) which need to be tested.
+        shard (tuple, optional): Defaults to None. If set `(i, N)`, only the
+            files in the `i`-th of `N` shards by path hash are tested, see
+            `televid.discovery.in_shard()`.
         """
 
-        folderpath = pathlib.Path(folderpath)
+        self.folderpath = pathlib.Path(folderpath)
+        self.ext = tuple(ext)
+        self.shard = shard
         self.total_running_time = None
         self.res = set()
         self.threshold = None
         self.scan_step = None
         self.multiproc_identify = None
         self.nmultiproc_run = None
+        self.shortlist = None
+        self.classifier = None
+        self.all_channels = False
+        self.samplerate = 8000
+        self.timeout = None
+        self.shared_memory = False
+        # The (path, error message) of each file failed to be identified.
+        self.failures = []
         self.golden_patterns_path = pathlib.Path('golden_wav')
         self.__golden_pattern = None
-        # Avoid generator since we need everything in TestTelevid instance to be
-        # picklable for multiprocessing.
-        self.__paths = list(itertools.chain.from_iterable(
-            folderpath.glob(e) for e in ext))
+        self.__index = None
+
+    def paths(self):
+        """ Discover the files to test lazily. Only the folder, extensions
+            and shard are kept, since everything in RunTelevid instance needs
+            to be picklable for multiprocessing.
+
+        Yields:
+            pathlib.Path: The path of each file in the shard.
+        """
+
+        for path in discover(self.folderpath, self.ext):
+            if self.shard is None or in_shard(path, self.shard,
+                                              self.folderpath):
+                yield path
 
     def run(self, threshold=None, scan_step=1, multiproc_identify=False,
-            nmultiproc_run=8, display_results=True):
+            nmultiproc_run=8, display_results=True, writers=(),
+            keep_results=True, shortlist=None, classifier=None,
+            all_channels=False, samplerate=8000, timeout=None,
+            shared_memory=False, golden_folderpath='wav', features='mfcc',
+            cache_folderpath=None):
         """ Get the comparison result for each testing audio files.
 
         threshold (float, optional): Defaults to None. The threshold for the
@@ -61,59 +111,225 @@ class RunTelevid():
             excute sequentially.
         display_results (bool, optional): Defaults to True. If set True, show
             the result in run time.
+        writers (tuple, optional): Defaults to empty. The `StreamWriter`
+            instances (see `televid.writers`) each result is written to as
+            soon as it arrives. The files (and channels, if `all_channels` is
+            set) which are already in the output of every writer (opened with
+            `resume=True`) are skipped.
+        keep_results (bool, optional): Defaults to True. If set False, the
+            results are not kept in `res` so the memory usage stays constant
+            for a long run with writers.
+        shortlist (int, optional): Defaults to None. If set, only this number
+            of golden patterns shortlisted by the `PatternIndex` are compared
+            for each file.
+        classifier (DiffsClassifier, optional): Defaults to None. The trained
+            classifier deciding the result types instead of the hand-tuned
+            thresholds. It must be trained with the same `samplerate`,
+            `features` and `shortlist`.
+        all_channels (bool, optional): Defaults to False. If set True, every
+            channel of each file is identified independently, and there is
+            one result for each channel.
+        samplerate (int, optional): Defaults to 8000. The sample rate to match
+            at. If set None, each file is matched at its native rate with the
+            golden patterns of that rate.
+        timeout (float, optional): Defaults to None. The seconds each file
+            may take. The comparison stopped by the timeout gives the best
+            result so far with `timed_out` set True. The file failed to be
+            decoded in time, or whose worker does not finish in time, is in
+            `failures` instead of the results.
+        shared_memory (bool, optional): Defaults to False. If set True, the
+            golden patterns are placed in shared memory once for all worker
+            processes of `nmultiproc_run`, and the results are sent back with
+            their target MFCC pattern in shared memory instead of pickled
+            (see `televid.shm`).
+        golden_folderpath (str, optional): Defaults to 'wav'. The folder path
+            (relative to `televid`) of the golden wavfiles.
+        features (str, optional): Defaults to 'mfcc'. The feature mode of the
+            golden patterns and target audio, 'mfcc' or 'mfcc+delta' (see
+            `Televid.load_golden_patterns()`).
+        cache_folderpath (str, optional): Defaults to None. The folder path
+            (relative to `televid`) where the MFCC features and index of
+            golden patterns are cached. If set None, it is
+            `golden_folderpath`.
+
+        Raise:
+            ValueError: The classifier is trained with other settings.
 
         Returns:
             set: A set containing all results in testing folder.
         """
 
+        if classifier is not None and not classifier.matches(
+                samplerate, features, shortlist):
+            raise ValueError(
+                'the classifier is trained at samplerate %s, features %s and '
+                'shortlist %s' % (classifier.samplerate, classifier.features,
+                                  classifier.shortlist))
         start_time = time.time()
         self.threshold = threshold
         self.scan_step = scan_step
         self.multiproc_identify = multiproc_identify
         self.nmultiproc_run = nmultiproc_run
-        self.__golden_pattern = televid.Televid.load_golden_patterns()
+        self.shortlist = shortlist
+        self.classifier = classifier
+        self.all_channels = all_channels
+        self.samplerate = samplerate
+        self.timeout = timeout
+        self.shared_memory = shared_memory
+        self.failures = []
+        if samplerate is None:
+            self.__golden_pattern = \
+                televid.Televid.load_golden_patterns_per_rate(
+                    golden_folderpath, features, cache_folderpath)
+        else:
+            self.__golden_pattern = televid.Televid.load_golden_patterns(
+                golden_folderpath, samplerate, features, cache_folderpath)
+        if shortlist:
+            self.__index = {
+                rate: PatternIndex.load_or_build(
+                    patterns, cache_folderpath or golden_folderpath)
+                for rate, patterns in (
+                    self.__golden_pattern.items() if samplerate is None
+                    else [(samplerate, self.__golden_pattern)])}
+
+        # Skip the results which every writer has already written in resume
+        # mode. They are keyed by the path relative to the folder, so that
+        # the folder given another way (e.g. `./data` or absolute) resumes as
+        # well, and by the channel.
+        done = dict()
+        if writers:
+            for relpath, channel in set.intersection(*(
+                    {(relative_path(path, self.folderpath), channel)
+                     for path, channel in writer.written}
+                    for writer in writers)):
+                done.setdefault(relpath, set()).add(channel)
+        skipped = 0
+
+        def pending_paths():
+            # Yield the path and its channels already written.
+            nonlocal skipped
+            for path in self.paths():
+                channels = (done.get(relative_path(path, self.folderpath),
+                                     set()) if done else set())
+                if not all_channels and None in channels:
+                    skipped += 1
+                    continue
+                if all_channels and channels:
+                    # The number of channels is unknown until it is decoded.
+                    skipped += 1
+                yield path, frozenset(channels)
+
+        def collect(outputs):
+            for output in outputs if isinstance(outputs, list) else [outputs]:
+                if keep_results:
+                    self.res.add(output)
+                for writer in writers:
+                    writer.write(output)
+                if display_results:
+                    self.display(output)
+
+        def fail(path, message):
+            self.failures.append((str(path), message))
+            logging.getLogger(__name__).error("Failed %s: %s", path, message)
 
         if nmultiproc_run is None or nmultiproc_run <= 1:
             # Run sequentially
-            for path in self.__paths:
-                output = self.identify_proc(path)
-                self.res.add(output)
-                if display_results:
-                    self.display(output)
+            for path, written in pending_paths():
+                try:
+                    output = self.identify_proc(path, written=written)
+                except Exception as err:  # pylint: disable=broad-except
+                    fail(path, '%s: %s' % (type(err).__name__, err))
+                    continue
+                collect(output)
         else:
             # Run parallelly
-            mp_queue = mp.Queue()
-            procs = []
-            for idx, path in enumerate(self.__paths):
-                if idx != 0 and idx % nmultiproc_run == 0:
-                    for proc in procs:
-                        proc.start()
-                    for _ in procs:
-                        output = mp_queue.get()
-                        self.res.add(output)
-                        if display_results:
-                            self.display(output)
-                    procs = []
-                procs.append(mp.Process(target=self.identify_proc,
-                                        args=(path, mp_queue)))
-
-            # If the number of processes cannot be devided evenly by
-            # nmultproc_run, get the result of the remaining processes.
-            if procs:
-                for proc in procs:
-                    proc.start()
-                for _ in procs:
-                    output = mp_queue.get()
-                    self.res.add(output)
-                    if display_results:
-                        self.display(output)
-
+            golden_patterns = self.__golden_pattern
+            with contextlib.ExitStack() as stack:
+                if shared_memory:
+                    self.__golden_pattern = self._share_golden_patterns(stack)
+                try:
+                    self._run_parallel(pending_paths(), collect, fail)
+                finally:
+                    self.__golden_pattern = golden_patterns
+
+        if skipped:
+            logging.getLogger(__name__).info(
+                "Resume: skipped the written results of %d files.", skipped)
+        for writer in writers:
+            writer.flush()
         self.total_running_time = time.time() - start_time
         logging.getLogger(__name__).info("Total time elapse: %f",
                                          self.total_running_time)
         return self.res
 
-    def identify_proc(self, filepath, mp_queue=None):
+    def _run_parallel(self, paths, collect, fail):
+        """ Identify the files in up to `nmultiproc_run` worker processes at
+            once, starting the next file as soon as a worker finishes, so the
+            files are fed to the workers as they are discovered.
+
+        paths (iterable): The paths of files and their channels already
+            written, consumed lazily.
+        collect (callable): Called with the output of each file.
+        fail (callable): Called with the path and error message of each
+            failed file.
+        """
+
+        mp_queue = mp.Queue()
+        paths = iter(paths)
+        # The process and deadline of each running file, by path string.
+        running = dict()
+        # The running files whose process has exited, given one more poll for
+        # their result still in the queue.
+        exited = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(running) < self.nmultiproc_run:
+                    path, written = next(paths, (None, None))
+                    if path is None:
+                        exhausted = True
+                        break
+                    # Each worker stops by itself at its deadline, this only
+                    # bounds the ones which do not.
+                    deadline = (None if self.timeout is None
+                                else time.time() + self.timeout)
+                    proc = mp.Process(target=self._identify_child,
+                                      args=(path, mp_queue, written, deadline))
+                    proc.start()
+                    running[str(path)] = (proc, deadline)
+                if not running:
+                    return
+                try:
+                    path, output = mp_queue.get(timeout=0.1)
+                except queue.Empty:
+                    now = time.time()
+                    for path, (proc, deadline) in list(running.items()):
+                        if (deadline is not None and proc.is_alive()
+                                and now > deadline + JOIN_GRACE):
+                            proc.terminate()
+                        if proc.is_alive():
+                            continue
+                        if path in exited:
+                            proc.join()
+                            del running[path]
+                            exited.discard(path)
+                            fail(path, 'worker exited without a result')
+                        else:
+                            exited.add(path)
+                    continue
+                running.pop(path)[0].join()
+                exited.discard(path)
+                if isinstance(output, str):
+                    fail(path, output)
+                else:
+                    collect(output)
+        finally:
+            for proc, _ in running.values():
+                proc.terminate()
+                proc.join()
+
+    def identify_proc(self, filepath, mp_queue=None, written=frozenset(),
+                      deadline=None):
         """ Calculate the result by calling the `identify()` of each Televid
             object.
 
@@ -122,19 +338,92 @@ class RunTelevid():
             mp_queue (multiprocessing.Queue, optional): Defaults to None.
                 The `Queue` instance for getting the result by multiprocess
                 `Process()`.
+            written (frozenset, optional): Defaults to empty. The channels
+                already written in resume mode, which are not identified
+                again if `all_channels` is set.
+            deadline (float, optional): Defaults to None. The `time.time()`
+                by which the file stops, shared by all of its channels. If
+                set None, it is `timeout` seconds from now.
 
         Returns:
             Televid: A Televid instance containing the result after
-                indentified.
+                indentified. If `all_channels` is set, a list of the Televid
+                instance of each channel.
         """
 
-        televoice = televid.Televid(filepath, self.__golden_pattern)
+        if deadline is None and self.timeout is not None:
+            deadline = time.time() + self.timeout
+
+        if self.all_channels:
+            televoices = [
+                televoice for televoice in televid.Televid.from_channels(
+                    filepath, self.__golden_pattern, self.classifier,
+                    self.samplerate, remaining_time(deadline))
+                if televoice.channel not in written]
+            # The channel processes get half the grace, so that the channels
+            # which finished are sent back before `_run_parallel()`
+            # terminates this worker.
+            televoices = televid.Televid.identify_channels(
+                televoices, threshold=self.threshold, scan_step=self.scan_step,
+                multiproc=self.multiproc_identify, deadline=deadline,
+                grace=JOIN_GRACE / 2)
+            if mp_queue is not None:
+                mp_queue.put(televoices)
+            return televoices
+
+        televoice = televid.Televid(filepath, self.__golden_pattern,
+                                    self.classifier, self.samplerate,
+                                    remaining_time(deadline))
         televoice.identify(threshold=self.threshold, scan_step=self.scan_step,
-                           multiproc=self.multiproc_identify)
+                           multiproc=self.multiproc_identify,
+                           index=(self.__index or {}).get(
+                               televoice.samplerate),
+                           shortlist=self.shortlist,
+                           timeout=remaining_time(deadline))
         if mp_queue is not None:
             mp_queue.put(televoice)
         return televoice
 
+    @profiling.worker
+    def _identify_child(self, filepath, mp_queue, written=frozenset(),
+                        deadline=None):
+        """ Run `identify_proc()` in a child process, sending the
+            `(path, output)` back, where the output is the error message
+            string if it fails.
+        """
+
+        try:
+            output = self.identify_proc(filepath, written=written,
+                                        deadline=deadline)
+        except Exception as err:  # pylint: disable=broad-except
+            output = '%s: %s' % (type(err).__name__, err)
+        else:
+            if self.shared_memory:
+                # The golden patterns are already shared, and pickled as
+                # their handles.
+                for televoice in (output if isinstance(output, list)
+                                  else [output]):
+                    televoice.target_mfcc = transfer(televoice.target_mfcc)
+        mp_queue.put((str(filepath), output))
+
+    def _share_golden_patterns(self, stack):
+        """ Place the golden patterns in shared memory until `stack` exits.
+
+        Returns:
+            dict: The golden patterns holding the shared views, or the ones
+                of each sample rate.
+        """
+
+        def share(patterns):
+            block, shared = share_patterns(patterns)
+            stack.callback(block.close)
+            return shared
+
+        if self.samplerate is None:
+            return {rate: share(patterns)
+                    for rate, patterns in self.__golden_pattern.items()}
+        return share(self.__golden_pattern)
+
     def save_results(self, detailed=True):
         """ Save the results as a readable csv file.
 
@@ -160,9 +449,7 @@ class RunTelevid():
             writer.writerow(('Name', 'Matched', 'Difference',
                              'Max Result Difference', 'Result Type',
                              'Is Correct', 'Identify Time', ''.join(msg)))
-            writer.writerows((r.filepath.name, *r.matched_pattern(True), r.mrd,
-                              r.result_type, r.is_correct, r.identify_time)
-                             for r in self.res)
+            writer.writerows(result_fields(r) for r in self.res)
         logging.getLogger(__name__).info("Results csv file has generated.")
 
     def save_mfcc_training_dataset(self):
@@ -189,9 +476,12 @@ class RunTelevid():
         Returns:
             Televid: The same object as argument `result`.
         """
+        name = result.filepath.name
+        if result.channel is not None:
+            name += '[%d]' % result.channel
         logging.getLogger(RunTelevid.display.__name__).info(
             '%25s%20s\t(%8.2f)\tMRD=%8.2f%13s%5s%9.5f(s)',
-            result.filepath.name,
+            name,
             *result.matched_pattern(True),
             result.mrd,
             result.result_type,
@@ -201,13 +491,182 @@ class RunTelevid():
         return result
 
 
-def main():
-    """ The main function. """
-
-    batch = RunTelevid('tests/data')
-    batch.run(threshold=1500, scan_step=3)
-    # batch.save_results()
+def split_input(text):
+    """ Split an input of the command line into the folder and the glob
+        pattern of files to test.
+
+    text (str): A folder, a file or a glob pattern, e.g. `archive/**/*.mp3`.
+
+    Returns:
+        tuple: (folderpath, patterns), or None if there is no such file or
+            folder.
+    """
+
+    path = pathlib.Path(text)
+    if path.is_dir():
+        return path, ('**/*.wav', '**/*.mp3')
+    if path.is_file():
+        return path.parent, (glob.escape(path.name),)
+    parts = path.parts
+    magic = [idx for idx, part in enumerate(parts) if glob.has_magic(part)]
+    if not magic:
+        return None
+    folderpath = pathlib.Path(*parts[:magic[0]]) if magic[0] else pathlib.Path()
+    return folderpath, ('/'.join(parts[magic[0]:]),)
+
+
+def parse_args(argv=None):
+    """ Parse the command-line arguments of `main()`. """
+
+    parser = argparse.ArgumentParser(
+        description='Identify the telecom voice of every audio file in the '
+        'inputs.')
+    parser.add_argument('inputs', nargs='*', default=['tests/data'],
+                        help='folders, files or glob patterns of audio files '
+                        '(default: tests/data)')
+    parser.add_argument('--backend', default='multiproc',
+                        choices=('sequential', 'multiproc', 'shm'),
+                        help='run the files one by one, in worker processes, '
+                        'or in worker processes sharing the golden patterns '
+                        'in shared memory (default: multiproc)')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='the number of worker processes (default: 8)')
+    parser.add_argument('--multiproc-identify', action='store_true',
+                        help='compare each file with the golden patterns in '
+                        'parallel as well')
+    parser.add_argument('--threshold', type=float, default=1500)
+    parser.add_argument('--scan-step', type=int, default=3)
+    parser.add_argument('--shortlist', type=int, default=None,
+                        help='compare only this number of golden patterns '
+                        'shortlisted by the pattern index')
+    parser.add_argument('--classifier', default=None,
+                        help='the trained classifier (.npz) deciding the '
+                        'result types (default: %s in the golden folder, if '
+                        'trained)' % CLASSIFIER_FILENAME)
+    parser.add_argument('--no-classifier', action='store_true',
+                        help='decide the result types by the hand-tuned '
+                        'thresholds even if the classifier is trained')
+    parser.add_argument('--features', default='mfcc',
+                        choices=televid.televid.FEATURES,
+                        help='match by the MFCCs only, or followed by their '
+                        'deltas (default: mfcc)')
+    parser.add_argument('--samplerate', default='8000',
+                        choices=('8000', '16000', 'native'))
+    parser.add_argument('--all-channels', action='store_true')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='the seconds each file may take')
+    parser.add_argument('--output', default=None,
+                        help='write the results to this file (or folder for '
+                        'npz) as they arrive')
+    parser.add_argument('--format', default=None, choices=sorted(WRITERS),
+                        help='the output format (default: by the suffix of '
+                        'output, npz if none)')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the files already in the output')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='test only the shard i/N of the files')
+    parser.add_argument('--golden', default=None,
+                        help='the folder of golden wavfiles (default: '
+                        'televid/wav)')
+    parser.add_argument('--cache', default=None,
+                        help='the folder to cache the features and index of '
+                        'golden patterns in (default: the golden folder)')
+    parser.add_argument('--profile', default=None,
+                        help='write the cProfile stats of the run, merged '
+                        'over the worker processes, to this file and their '
+                        'summary beside it (.txt)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not display each result')
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error('--workers must be positive')
+    if args.backend == 'shm' and args.workers == 1:
+        parser.error('--backend shm needs more than one worker')
+    if args.resume and args.output is None:
+        parser.error('--resume requires --output')
+    if args.classifier is not None and args.no_classifier:
+        parser.error('--classifier and --no-classifier are exclusive')
+    if args.output is not None and args.format is None:
+        args.format = {'.csv': 'csv', '.jsonl': 'jsonl'}.get(
+            pathlib.Path(args.output).suffix, 'npz')
+    # The golden and cache folders given are relative to the working
+    # directory instead of televid.
+    args.golden = ('wav' if args.golden is None
+                   else str(pathlib.Path(args.golden).resolve()))
+    if args.cache is not None:
+        args.cache = str(pathlib.Path(args.cache).resolve())
+    args.sources = []
+    for text in args.inputs:
+        source = split_input(text)
+        if source is None:
+            parser.error('no such file or folder: %s' % text)
+        args.sources.append(source)
+    return args
+
+
+def main(argv=None):
+    """ The main function.
+
+    argv (list, optional): Defaults to None. The command-line arguments,
+        `sys.argv[1:]` if None.
+
+    Returns:
+        int: The exit status.
+    """
+
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    batches = [RunTelevid(folderpath, patterns, args.shard)
+               for folderpath, patterns in args.sources]
+    if all(next(batch.paths(), None) is None for batch in batches):
+        logging.getLogger(__name__).error("No file matches the inputs.")
+        return EXIT_NO_INPUTS
+
+    samplerate = None if args.samplerate == 'native' else int(args.samplerate)
+    if args.no_classifier:
+        classifier = None
+    elif args.classifier is None:
+        classifier = DiffsClassifier.load_default(
+            args.golden, samplerate, args.features, args.shortlist)
+    else:
+        classifier = DiffsClassifier.load(args.classifier)
+        if not classifier.matches(samplerate, args.features, args.shortlist):
+            logging.getLogger(__name__).error(
+                "The classifier is trained at samplerate %s, features %s and "
+                "shortlist %s.", classifier.samplerate, classifier.features,
+                classifier.shortlist)
+            return EXIT_USAGE
+
+    with contextlib.ExitStack() as stack:
+        writers = ()
+        if args.output is not None:
+            writers = (stack.enter_context(
+                WRITERS[args.format](args.output, args.resume)),)
+        if args.profile is not None:
+            stack.enter_context(profiling.profile(args.profile))
+        failures = []
+        for batch in batches:
+            batch.run(threshold=args.threshold, scan_step=args.scan_step,
+                      multiproc_identify=args.multiproc_identify,
+                      nmultiproc_run=(1 if args.backend == 'sequential'
+                                      else args.workers),
+                      display_results=not args.quiet, writers=writers,
+                      keep_results=False, shortlist=args.shortlist,
+                      classifier=classifier, all_channels=args.all_channels,
+                      samplerate=samplerate, timeout=args.timeout,
+                      shared_memory=args.backend == 'shm',
+                      golden_folderpath=args.golden,
+                      features=args.features,
+                      cache_folderpath=args.cache)
+            failures.extend(batch.failures)
+
+    if failures:
+        logging.getLogger(__name__).error("%d files failed.", len(failures))
+        return EXIT_FAILURES
+    return EXIT_OK
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,369 @@
+""" The long-running classification server. The golden patterns are loaded
+once in every worker of a warm process pool, so the startup cost is amortized
+over all requests instead of being paid by each classification.
+
+Endpoints (HTTP on a local socket):
+    POST /classify  Classify the audio file content in the request body, or
+                    the file of `{"path": ...}` if the body is JSON. The query
+                    `threshold` and `scan_step` are passed to `identify()`,
+                    and `name` names the uploaded content. The infinite
+                    differences, of the comparisons stopped by the threshold,
+                    are null.
+    GET  /health    Whether the server is ready, 503 if the worker pool is
+                    broken.
+    GET  /metrics   The counters of requests, batches and latency.
+
+Concurrent requests are collected into micro-batches, and each batch is split
+evenly over the workers, one task per worker at most. The requests of a batch
+are therefore still classified in parallel, and batching only saves the
+per-task cost when there are more requests than workers. Every worker checks
+the golden folder before each task, so the added or updated golden wavfiles
+are used without restarting it.
+"""
+
+import argparse
+import concurrent.futures
+import http.server
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.parse
+
+import televid
+from televid.registry import PatternRegistry
+from televid.writers import json_safe
+
+
+# The golden pattern registry of the worker process, loaded by
+# `_init_worker()`.
+_WORKER_REGISTRY = None
+
+
+def _init_worker():
+    """ Load the golden patterns once when the worker process starts. """
+
+    global _WORKER_REGISTRY  # pylint: disable=global-statement
+    _WORKER_REGISTRY = PatternRegistry()
+
+
+def _classify_batch(items):
+    """ Classify a micro-batch in the worker process.
+
+    Args:
+        items (list): The `(source, name, threshold, scan_step)` tuples, where
+            the source is either a path or the content of the audio file.
+
+    Returns:
+        list: The result dict or the error message string of each item.
+    """
+
+    try:
+        _WORKER_REGISTRY.reload()
+    except Exception:  # pylint: disable=broad-except
+        logging.getLogger(__name__).exception("Reload failed, keep the "
+                                              "previous golden patterns.")
+    outputs = []
+    for source, name, threshold, scan_step in items:
+        try:
+            if isinstance(source, bytes):
+                rate, signal = televid.decode(source)
+                televoice = televid.Televid.from_signal(
+                    signal, rate, _WORKER_REGISTRY, name)
+            else:
+                televoice = televid.Televid(source, _WORKER_REGISTRY)
+            televoice.identify(threshold=threshold, scan_step=scan_step)
+            matched, difference = televoice.matched_pattern(True)
+            outputs.append({'name': televoice.filepath.name,
+                            'matched': matched,
+                            'difference': difference,
+                            'mrd': televoice.mrd,
+                            'result_type': televoice.result_type,
+                            'identify_time': televoice.identify_time,
+                            'region': televoice.match_region(),
+                            'diffs': televoice.diffs})
+        except Exception as err:  # pylint: disable=broad-except
+            outputs.append('%s: %s' % (type(err).__name__, err))
+    return outputs
+
+
+class Metrics():
+    """ The thread-safe counters exposed by `/metrics`. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.tasks = 0
+        self.total_latency = 0.0
+
+    def add(self, **counts):
+        """ Increase the counters by the given amount. """
+
+        with self._lock:
+            for key, val in counts.items():
+                setattr(self, key, getattr(self, key) + val)
+
+    def snapshot(self):
+        """ Get the counters and the derived averages as a dict. """
+
+        with self._lock:
+            return {'uptime': time.time() - self.started,
+                    'requests': self.requests,
+                    'errors': self.errors,
+                    'batches': self.batches,
+                    'tasks': self.tasks,
+                    'mean_batch_size': (self.batched_items / self.batches
+                                        if self.batches else 0.0),
+                    'mean_latency': (self.total_latency / self.requests
+                                     if self.requests else 0.0)}
+
+
+class Batcher():
+    """ Collect the concurrent requests into micro-batches for the pool. """
+
+    def __init__(self, pool, metrics, batch_size=8, batch_wait=0.01,
+                 workers=1):
+        """ Start the batching thread.
+
+        pool (concurrent.futures.Executor): The warm worker pool.
+        metrics (Metrics): The counters to update.
+        batch_size (int, optional): Defaults to 8. The maximum number of
+            requests in one batch.
+        batch_wait (float, optional): Defaults to 0.01. The seconds to wait
+            for more requests after the first one of a batch arrives.
+        workers (int, optional): Defaults to 1. The number of workers in the
+            pool, which a batch is split over.
+        """
+
+        self.pool = pool
+        self.metrics = metrics
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """ Queue one `(source, name, threshold, scan_step)` item.
+
+        Returns:
+            concurrent.futures.Future: The future of its output.
+        """
+
+        future = concurrent.futures.Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        """ Stop the batching thread. """
+
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    nxt = self._queue.get(
+                        timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)
+                    break
+                batch.append(nxt)
+            # Split the batch over the workers, so that its requests are not
+            # serialized in one of them while the others are idle.
+            ntasks = min(len(batch), self.workers)
+            self.metrics.add(batches=1, batched_items=len(batch),
+                             tasks=ntasks)
+            for idx in range(ntasks):
+                task = batch[idx::ntasks]
+                try:
+                    batch_future = self.pool.submit(_classify_batch,
+                                                    [i for i, _ in task])
+                except Exception as err:  # pylint: disable=broad-except
+                    # The pool is broken or shut down, fail the requests
+                    # instead of the batching thread.
+                    batch_future = concurrent.futures.Future()
+                    batch_future.set_exception(err)
+                batch_future.add_done_callback(
+                    _resolver([f for _, f in task]))
+
+
+def _resolver(futures):
+    """ Get the callback setting the outputs of a batch to its futures. """
+
+    def resolve(batch_future):
+        try:
+            outputs = batch_future.result()
+        except Exception as err:  # pylint: disable=broad-except
+            outputs = ['%s: %s' % (type(err).__name__, err)] * len(futures)
+        for future, output in zip(futures, outputs):
+            future.set_result(output)
+    return resolve
+
+
+class TelevidRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Handle the requests of `TelevidServer`. """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Serve `/health` and `/metrics`. """
+
+        path = urllib.parse.urlsplit(self.path).path
+        if path == '/health':
+            if self.server.healthy():
+                self._send(200, {'status': 'ok'})
+            else:
+                self._send(503, {'status': 'broken'})
+        elif path == '/metrics':
+            self._send(200, self.server.metrics.snapshot())
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """ Serve `/classify`. """
+
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/classify':
+            self._send(404, {'error': 'not found'})
+            return
+        start_time = time.time()
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError('negative Content-Length: %d' % length)
+        except ValueError as err:
+            # The body cannot be skipped, so the connection is not reused.
+            self.close_connection = True
+            self.server.metrics.add(requests=1, errors=1)
+            self._send(400, {'error': '%s: %s' % (type(err).__name__, err)})
+            return
+        body = self.rfile.read(length)
+        try:
+            threshold = (float(query['threshold'][0])
+                         if 'threshold' in query else None)
+            scan_step = int(query.get('scan_step', [1])[0])
+            if self.headers.get_content_type() == 'application/json':
+                # TypeError if the JSON is not an object.
+                source = json.loads(body.decode())['path']
+                name = source
+            else:
+                source = body
+                name = query.get('name', [''])[0]
+        except (ValueError, KeyError, TypeError) as err:
+            self.server.metrics.add(requests=1, errors=1)
+            self._send(400, {'error': '%s: %s' % (type(err).__name__, err)})
+            return
+
+        output = self.server.batcher.submit(
+            (source, name, threshold, scan_step)).result()
+        failed = isinstance(output, str)
+        self.server.metrics.add(requests=1, errors=int(failed),
+                                total_latency=time.time() - start_time)
+        if failed:
+            self._send(422, {'error': output})
+        else:
+            self._send(200, output)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.getLogger(__name__).debug(format, *args)
+
+    def _send(self, code, content):
+        data = json.dumps(json_safe(content), allow_nan=False).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class TelevidServer(http.server.ThreadingHTTPServer):
+    """ The HTTP server holding the warm worker pool. """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 8000), workers=None,
+                 batch_size=8, batch_wait=0.01):
+        """ Warm up the worker pool and bind the server.
+
+        address (tuple, optional): Defaults to ('127.0.0.1', 8000). The host
+            and port to listen. Port 0 picks a free port.
+        workers (int, optional): Defaults to None. The number of worker
+            processes. If set None, it is the number of CPUs.
+        batch_size (int, optional): Defaults to 8. The maximum number of
+            requests in one micro-batch.
+        batch_wait (float, optional): Defaults to 0.01. The seconds to wait
+            for filling a micro-batch.
+        """
+
+        workers = workers or os.cpu_count()
+        # Build the pickle of golden patterns before the workers load it.
+        PatternRegistry()
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=_init_worker)
+        # Keep every worker busy for a moment so that all of them are started
+        # now rather than on the first requests.
+        list(self.pool.map(time.sleep, [0.1] * workers))
+        self.metrics = Metrics()
+        self.batcher = Batcher(self.pool, self.metrics, batch_size, batch_wait,
+                               workers)
+        super().__init__(address, TelevidRequestHandler)
+
+    def healthy(self):
+        """ Whether the worker pool still takes tasks, i.e. it is neither
+            broken by a dead worker nor shut down.
+        """
+
+        try:
+            # A broken pool refuses at once, a working one runs this no-op.
+            self.pool.submit(int)
+        except (concurrent.futures.BrokenExecutor, RuntimeError):
+            return False
+        return True
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+        self.pool.shutdown()
+
+
+def main():
+    """ The main function. """
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--batch-wait', type=float, default=0.01)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = TelevidServer((args.host, args.port), args.workers,
+                           args.batch_size, args.batch_wait)
+    logging.getLogger(__name__).info("Serving on %s:%d",
+                                     *server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1 @@
-from televid.televid import Televid
+from televid.televid import Televid, decode
@@ -0,0 +1,203 @@
+""" The asyncio front end of `Televid` for integrating into asyncio services.
+
+The target audio is decoded through the FFmpeg subprocess created by
+`asyncio.create_subprocess_exec()`, so the event loop is never blocked while
+waiting for FFmpeg. The CPU-bound MFCC feature and pattern comparison are
+offloaded to an executor. Following is an example.
+
+    classifier = AsyncTelevid(executor=ProcessPoolExecutor())
+    televoice = await classifier.classify('tests/data/inbusy.mp3')
+    televoice.result_type  # 'inbusy'
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import pathlib
+
+import ffmpeg
+
+from .registry import PatternRegistry
+from .televid import STOP_CANCEL, Televid, ffmpeg_stream, read_wav_stdout
+
+
+async def decode_async(source):
+    """ Decode the target audio with the FFmpeg subprocess. The subprocess is
+        killed if the calling task is cancelled.
+
+    source (str or bytes): The path of target file, or the content of target
+        file which will be fed through the stdin pipe.
+
+    Raise:
+        ffmpeg.Error: FFmpeg returns a nonzero exit code.
+
+    Returns:
+        tuple: (rate, signal)
+    """
+
+    stdin = isinstance(source, (bytes, bytearray, memoryview))
+    args = ffmpeg_stream(source).compile()
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE if stdin else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, err = await proc.communicate(bytes(source) if stdin else None)
+    except asyncio.CancelledError:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', stdout, err)
+    return read_wav_stdout(stdout)
+
+
+class _StopFlag():
+    """ The stand-in of `multiprocessing.Value` for stopping the comparison
+        running in a thread.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+
+def _identify_signal(signal, rate, golden_patterns, filepath, threshold,
+                     scan_step, stop_flag=None, cachepath=None,
+                     reload_interval=1.0):
+    """ The CPU-bound part of the classification run in the executor. """
+
+    registry = None
+    if golden_patterns is None:
+        registry = golden_patterns = _worker_golden_patterns(cachepath)
+        try:
+            registry.reload(min_interval=reload_interval)
+        except Exception:  # pylint: disable=broad-except
+            logging.getLogger(__name__).exception(
+                "Reload failed, keep the previous golden patterns.")
+    televoice = Televid.from_signal(signal, rate, golden_patterns, filepath)
+    televoice.identify(threshold=threshold, scan_step=scan_step,
+                       stop_flag=stop_flag)
+    if registry is not None:
+        # Otherwise the whole registry is pickled back from process workers.
+        televoice.golden_patterns = None
+    return televoice
+
+
+@functools.lru_cache(maxsize=None)
+def _worker_golden_patterns(cachepath=None):
+    """ Load the golden pattern registry once in each executor worker. """
+
+    return PatternRegistry(cachepath=cachepath)
+
+
+class AsyncTelevid():
+    """ Classify target audio files without blocking the event loop. """
+
+    def __init__(self, golden_patterns=None, executor=None,
+                 max_concurrency=None, cachepath=None,
+                 reload_interval=1.0):
+        """ Set up the executor and concurrency limit.
+
+        golden_patterns (dict, optional): Defaults to None. The golden
+            patterns with file name as key. If set None, each executor worker
+            loads the default golden patterns once by itself, which saves
+            sending them to process workers on every call, and reloads the
+            updated golden wavfiles before the classifications. The results
+            do not hold the golden patterns then.
+        executor (concurrent.futures.Executor, optional): Defaults to None.
+            The executor running the MFCC feature and pattern comparison. If
+            set None, the default executor of the event loop is used.
+        max_concurrency (int, optional): Defaults to None. The maximum number
+            of classifications running at once. If set None, there is no
+            limit other than the executor itself.
+        cachepath (str, optional): Defaults to None. The folder path of the
+            pickle of the golden patterns loaded by the workers, see
+            `Televid.load_golden_patterns()`.
+        reload_interval (float, optional): Defaults to 1.0. The minimum
+            seconds between the checks of the golden folder by each worker.
+        """
+
+        self.golden_patterns = golden_patterns
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.cachepath = cachepath
+        self.reload_interval = reload_interval
+        self._semaphore = None
+
+    async def classify(self, source, threshold=None, scan_step=1,
+                       filepath=None):
+        """ Classify the target audio.
+
+        Cancelling the calling task kills the FFmpeg subprocess. When the
+        executor is thread-based, the running comparison is stopped as well;
+        a process worker finishes its comparison but the result is dropped.
+
+        source (str or bytes): The path of target file, or its content.
+        threshold (int, optional): Defaults to None. The threshold for the
+            least difference to stop the comparison.
+        scan_step (int, optional): Defaults to 1. The step of scanning on
+            frame of target MFCC pattern.
+        filepath (str, optional): Defaults to None. The name reported as
+            `filepath` of the result. If set None, it is `source` if `source`
+            is a path, otherwise ''.
+
+        Returns:
+            Televid: A Televid instance containing the result after
+                indentified.
+        """
+
+        if self._semaphore is None and self.max_concurrency:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._semaphore is None:
+            return await self._classify(source, threshold, scan_step, filepath)
+        async with self._semaphore:
+            return await self._classify(source, threshold, scan_step, filepath)
+
+    async def _classify(self, source, threshold, scan_step, filepath):
+        if not isinstance(source, (bytes, bytearray, memoryview)):
+            if not pathlib.Path(source).exists():
+                raise FileNotFoundError('not such file: %s' % str(source))
+            if filepath is None:
+                filepath = source
+        rate, signal = await decode_async(source)
+
+        # A plain object cannot be shared with process workers, so only the
+        # thread-based executors get the stop flag.
+        stop_flag = (None if isinstance(self.executor,
+                                        concurrent.futures.ProcessPoolExecutor)
+                     else _StopFlag())
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, _identify_signal, signal, rate,
+            self.golden_patterns, str(filepath or ''), threshold, scan_step,
+            stop_flag, self.cachepath, self.reload_interval)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if stop_flag is not None:
+                stop_flag.value = STOP_CANCEL
+            raise
+
+
+async def classify_async(source, golden_patterns=None, threshold=None,
+                         scan_step=1, executor=None):
+    """ Classify the target audio once. See `AsyncTelevid.classify()`.
+
+    source (str or bytes): The path of target file, or its content.
+    golden_patterns (dict, optional): Defaults to None. The golden patterns
+        with file name as key. If set None, the default ones are loaded.
+    threshold (int, optional): Defaults to None. The threshold for the least
+        difference to stop the comparison.
+    scan_step (int, optional): Defaults to 1. The step of scanning on frame
+        of target MFCC pattern.
+    executor (concurrent.futures.Executor, optional): Defaults to None. The
+        executor running the MFCC feature and pattern comparison.
+
+    Returns:
+        Televid: A Televid instance containing the result after indentified.
+    """
+
+    return await AsyncTelevid(golden_patterns, executor).classify(
+        source, threshold=threshold, scan_step=scan_step)
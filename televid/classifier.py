@@ -0,0 +1,279 @@
+""" The trainable classifier of `Televid.diffs`, replacing the hand-tuned
+thresholds of `Televid.result_type`. It is a multinomial logistic regression
+in NumPy only, trained from the `(diffs, result_type)` dataset generated by
+`RunTelevid.save_mfcc_training_dataset()` or the dataset writers.
+
+The features of one `diffs` are the standardized logarithms of the difference
+to each golden pattern. The missing and infinite differences (e.g. golden
+pattern longer than target, or stopped by threshold) are set to the mean, so
+they contribute nothing and a partial `diffs` is classified by the compared
+golden patterns only.
+
+Train and save it as `classifier.npz` alongside the golden patterns by:
+
+    python -m televid.classifier dataset.pkl
+
+The sample rate, feature mode and shortlist the dataset is matched with are
+saved with it, since the diffs of other settings are of another scale or of
+other golden patterns. Give them by `--samplerate`, `--features` and
+`--shortlist` if they are not the defaults.
+"""
+
+import argparse
+import logging
+import os
+import pathlib
+import threading
+import warnings
+import zipfile
+
+import numpy as np
+
+
+CLASSIFIER_FILENAME = 'classifier.npz'
+
+
+class DiffsClassifier():
+    """ Classify the result type from the differences between the target and
+        each golden pattern. Every method takes a batch of `diffs`.
+    """
+
+    def __init__(self, names, classes, mean, std, weights, bias,
+                 samplerate=8000, features='mfcc', shortlist=None):
+        """ Hold the trained parameters. Use `train()` or `load()` to get one.
+
+        names (list): The golden pattern names in the order of features.
+        classes (list): The result types.
+        mean (numpy.array): The mean of features for standardization.
+        std (numpy.array): The standard deviation of features.
+        weights (numpy.array): The weights of size features * classes.
+        bias (numpy.array): The bias of each class.
+        samplerate (int, optional): Defaults to 8000. The sample rate the
+            diffs of the dataset are matched at, None for the native rates.
+        features (str, optional): Defaults to 'mfcc'. The feature mode the
+            diffs of the dataset are matched by.
+        shortlist (int, optional): Defaults to None. The number of golden
+            patterns shortlisted for the diffs of the dataset, None for all.
+        """
+
+        self.names = list(names)
+        self.classes = list(classes)
+        self.mean = np.asarray(mean)
+        self.std = np.asarray(std)
+        self.weights = np.asarray(weights)
+        self.bias = np.asarray(bias)
+        self.samplerate = samplerate
+        self.features = features
+        self.shortlist = shortlist
+
+    @classmethod
+    def train(cls, dataset, l2=1e-3, learning_rate=0.5, epochs=2000,
+              samplerate=8000, features='mfcc', shortlist=None):
+        """ Train by full-batch gradient descent.
+
+        dataset (list): The `(diffs, result_type)` tuples.
+        l2 (float, optional): Defaults to 1e-3. The L2 regularization.
+        learning_rate (float, optional): Defaults to 0.5. The step size.
+        epochs (int, optional): Defaults to 2000. The number of steps.
+        samplerate (int, optional): Defaults to 8000. The sample rate the
+            dataset is matched at, see `RunTelevid.run()`.
+        features (str, optional): Defaults to 'mfcc'. The feature mode the
+            dataset is matched by.
+        shortlist (int, optional): Defaults to None. The shortlist the
+            dataset is matched with.
+
+        Returns:
+            DiffsClassifier: The trained classifier.
+        """
+
+        diffs_list, labels = zip(*dataset)
+        names = sorted(set().union(*diffs_list))
+        classes = sorted(set(labels))
+        feats = _features(diffs_list, names)
+        with warnings.catch_warnings():
+            # A golden pattern may never be compared, the NaN is handled below.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = np.nanmean(feats, axis=0)
+            std = np.nanstd(feats, axis=0)
+        mean[np.isnan(mean)] = 0
+        std[np.isnan(std) | (std == 0)] = 1
+        feats = _standardize(feats, mean, std)
+
+        onehot = np.zeros((len(labels), len(classes)))
+        onehot[np.arange(len(labels)),
+               [classes.index(label) for label in labels]] = 1
+        weights = np.zeros((feats.shape[1], len(classes)))
+        bias = np.zeros(len(classes))
+        for _ in range(epochs):
+            grad = (_softmax(feats.dot(weights) + bias) - onehot) / len(labels)
+            weights -= learning_rate * (feats.T.dot(grad) + l2 * weights)
+            bias -= learning_rate * grad.sum(axis=0)
+        return cls(names, classes, mean, std, weights, bias, samplerate,
+                   features, shortlist)
+
+    def matches(self, samplerate=8000, features='mfcc', shortlist=None):
+        """ Whether the diffs matched with these settings are of the same
+            scale and golden patterns as the dataset it is trained on.
+        """
+
+        return ((self.samplerate, self.features, self.shortlist)
+                == (samplerate, features, shortlist or None))
+
+    def predict_proba(self, diffs_list):
+        """ Get the probability of each class.
+
+        diffs_list (list): The `diffs` dicts. The golden patterns missing in
+            a `diffs` or with infinite difference contribute nothing.
+
+        Returns:
+            numpy.array: The probabilities of size len(diffs_list) * classes.
+        """
+
+        feats = _standardize(_features(diffs_list, self.names), self.mean,
+                             self.std)
+        return _softmax(feats.dot(self.weights) + self.bias)
+
+    def predict(self, diffs_list):
+        """ Get the result type of each `diffs`.
+
+        Returns:
+            list: The result types.
+        """
+
+        return [self.classes[i]
+                for i in self.predict_proba(diffs_list).argmax(axis=1)]
+
+    def save(self, filepath):
+        """ Save the classifier as a .npz file. """
+
+        filepath = pathlib.Path(filepath)
+        # Write to a temporary file of this process first, so that the
+        # processes loading the classifier never see a half-written one.
+        tmp = filepath.with_name('%s.%d.%d.tmp' % (
+            filepath.name, os.getpid(), threading.get_ident()))
+        try:
+            with tmp.open('wb') as npzfile:
+                # 0 stands for None of the samplerate and shortlist.
+                np.savez(npzfile, names=np.array(self.names),
+                         classes=np.array(self.classes), mean=self.mean,
+                         std=self.std, weights=self.weights, bias=self.bias,
+                         samplerate=np.array(self.samplerate or 0),
+                         features=np.array(self.features),
+                         shortlist=np.array(self.shortlist or 0))
+            tmp.replace(filepath)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    @classmethod
+    def load(cls, filepath):
+        """ Load the classifier saved by `save()`. The one saved without the
+            settings is trained with the default ones.
+        """
+
+        with np.load(str(filepath)) as npz:
+            settings = dict()
+            if 'samplerate' in npz.files:
+                settings = dict(samplerate=int(npz['samplerate']) or None,
+                                features=str(npz['features']),
+                                shortlist=int(npz['shortlist']) or None)
+            return cls(npz['names'].tolist(), npz['classes'].tolist(),
+                       npz['mean'], npz['std'], npz['weights'], npz['bias'],
+                       **settings)
+
+    @classmethod
+    def load_default(cls, folderpath='wav', samplerate=8000, features='mfcc',
+                     shortlist=None):
+        """ Load the classifier saved alongside the golden patterns, if it
+            is trained with the same settings, see `matches()`.
+
+        folderpath (str, optional): Defaults to 'wav'. The relative folder
+            path (relative to this script) of the golden wavfiles.
+        samplerate (int, optional): Defaults to 8000. The sample rate to
+            match at.
+        features (str, optional): Defaults to 'mfcc'. The feature mode.
+        shortlist (int, optional): Defaults to None. The shortlist.
+
+        Returns:
+            DiffsClassifier: The classifier, or None if it is not trained or
+                trained with other settings.
+        """
+
+        filepath = pathlib.Path(__file__).parent.joinpath(folderpath,
+                                                          CLASSIFIER_FILENAME)
+        try:
+            classifier = cls.load(filepath)
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        if not classifier.matches(samplerate, features, shortlist):
+            logging.getLogger(__name__).warning(
+                "Skip %s trained at samplerate %s, features %s and shortlist "
+                "%s.", filepath, classifier.samplerate, classifier.features,
+                classifier.shortlist)
+            return None
+        return classifier
+
+
+def _features(diffs_list, names):
+    """ Get the log differences in the order of `names`. The missing and
+        infinite ones are NaN.
+    """
+
+    feats = np.array([[diffs.get(n, np.nan) for n in names]
+                      for diffs in diffs_list], dtype=float).reshape(
+                          len(diffs_list), len(names))
+    feats[np.isinf(feats)] = np.nan
+    return np.log1p(feats)
+
+
+def _standardize(feats, mean, std):
+    """ Standardize the features, where NaN becomes 0, the mean. """
+
+    return np.nan_to_num((feats - mean) / std)
+
+
+def _softmax(logits):
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def main():
+    """ Train the classifier from a dataset and save it. """
+
+    from .televid import FEATURES
+    from .writers import load_dataset
+
+    parser = argparse.ArgumentParser(description='Train the classifier of '
+                                     'result types from a diffs dataset.')
+    parser.add_argument('dataset', help='dataset.pkl, .jsonl or .npz folder')
+    parser.add_argument('--output', default=None,
+                        help='defaults to %s alongside the golden patterns'
+                        % CLASSIFIER_FILENAME)
+    parser.add_argument('--samplerate', default='8000',
+                        choices=('8000', '16000', 'native'),
+                        help='the sample rate the dataset is matched at')
+    parser.add_argument('--features', default='mfcc',
+                        choices=FEATURES,
+                        help='the feature mode the dataset is matched by')
+    parser.add_argument('--shortlist', type=int, default=None,
+                        help='the shortlist the dataset is matched with')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    dataset = load_dataset(args.dataset)
+    classifier = DiffsClassifier.train(
+        dataset, samplerate=(None if args.samplerate == 'native'
+                             else int(args.samplerate)),
+        features=args.features, shortlist=args.shortlist)
+    accuracy = np.mean(np.array(classifier.predict([d for d, _ in dataset]))
+                       == np.array([t for _, t in dataset]))
+    output = args.output or pathlib.Path(__file__).parent.joinpath(
+        'wav', CLASSIFIER_FILENAME)
+    classifier.save(output)
+    logging.getLogger(__name__).info("Trained on %d samples, accuracy %.3f, "
+                                     "saved to %s", len(dataset), accuracy,
+                                     output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+""" The streaming discovery of target audio files for directory-scale runs.
+
+The folder is walked by `os.scandir()` once for every pattern together, and
+the matched files are yielded as they are found, so the work on the first
+files starts before the walk of a large archive finishes. Each directory is
+listed in sorted order, so the order is deterministic.
+
+A run can be split over machines without coordination by sharding: every
+file belongs to the shard given by the hash of its path relative to the
+folder, so every machine computes the same split of the same archive.
+"""
+
+import fnmatch
+import hashlib
+import os
+import pathlib
+
+
+def discover(folderpath, patterns=('**/*.wav', '**/*.mp3')):
+    """ Find the files matching any of the patterns lazily.
+
+    folderpath (str): The folder to search.
+    patterns (tuple, optional): Defaults to ('**/*.wav', '**/*.mp3'). The glob
+        patterns relative to the folder. A pattern `**/NAME` matches NAME in
+        every subfolder, and `NAME` in the folder only. The other patterns
+        are globbed by `pathlib` after the walk.
+
+    Yields:
+        pathlib.Path: The path of each matched file, once even if it matches
+            several patterns.
+    """
+
+    folderpath = pathlib.Path(folderpath)
+    recursive, toplevel, others = [], [], []
+    for pattern in patterns:
+        if '/' not in pattern:
+            toplevel.append(pattern)
+        elif pattern.startswith('**/') and '/' not in pattern[3:]:
+            recursive.append(pattern[3:])
+        else:
+            others.append(pattern)
+
+    def matches(name, names):
+        return any(fnmatch.fnmatchcase(name, n) for n in names)
+
+    stack = [(folderpath, True)]
+    while stack:
+        folder, top = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                entries = sorted(entries, key=lambda e: e.name)
+        except OSError:
+            # Removed or unreadable meanwhile.
+            continue
+        subfolders = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    subfolders.append((pathlib.Path(entry.path), False))
+            elif (matches(entry.name, recursive)
+                  or (top and matches(entry.name, toplevel))):
+                yield pathlib.Path(entry.path)
+        # Visit the subfolders in sorted order.
+        stack.extend(reversed(subfolders))
+
+    # The files matched by the walk are skipped, and so are the ones matched
+    # by an earlier one of the other patterns.
+    seen = set()
+    for pattern in others:
+        for path in folderpath.glob(pattern):
+            relpath = path.relative_to(folderpath)
+            if path in seen or matches(path.name, recursive) or (
+                    len(relpath.parts) == 1 and matches(path.name, toplevel)):
+                continue
+            seen.add(path)
+            yield path
+
+
+def parse_shard(shard):
+    """ Parse the shard of the form `i/N`, the `i`-th of `N` shards counting
+        from 0.
+
+    Raise:
+        ValueError: The shard is malformed or out of range.
+
+    Returns:
+        tuple: (i, N)
+    """
+
+    index, _, count = str(shard).partition('/')
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError('shard %d/%d is out of range' % (index, count))
+    return index, count
+
+
+def relative_path(path, folderpath='.'):
+    """ Get the path relative to the folder in POSIX form, which is the same
+        however the folder is spelled (e.g. `./data`, `data` or absolute).
+
+    path (str): The path of file.
+    folderpath (str, optional): Defaults to '.'. The folder.
+
+    Returns:
+        str: The relative path.
+    """
+
+    return pathlib.PurePath(os.path.relpath(path, folderpath)).as_posix()
+
+
+def in_shard(path, shard, folderpath='.'):
+    """ Check the file belongs to the shard.
+
+    path (str): The path of file.
+    shard (tuple): The `(i, N)` of shard, see `parse_shard()`.
+    folderpath (str, optional): Defaults to '.'. The root of the paths being
+        sharded. The hash is of the path relative to it, so that the machines
+        mounting the archive at different places agree.
+
+    Returns:
+        bool: Whether the file is in the shard.
+    """
+
+    index, count = shard
+    digest = hashlib.md5(relative_path(path, folderpath).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count == index
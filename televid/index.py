@@ -0,0 +1,203 @@
+""" The index of golden patterns for shortlisting the candidates before the
+full sliding-window comparison in `Televid.identify()`.
+
+Each golden pattern is embedded as a fixed-length vector, the mean and the
+standard deviation of every MFCC coefficient over its frames. The target MFCC
+pattern is embedded the same way on every sliding window, which is cheap by
+cumulative sums, and the patterns whose embeddings are nearest to any window
+are the candidates. Patterns of similar length share the same target windows,
+so the cost grows with the number of length buckets rather than the number of
+patterns.
+"""
+
+import logging
+import os
+import pathlib
+import threading
+import zipfile
+
+import numpy as np
+
+from .televid import pattern_suffix
+
+
+INDEX_FILENAME = 'golden_index.npz'
+
+
+def embed(pattern):
+    """ Embed a MFCC pattern as the mean and standard deviation of its
+        coefficients.
+
+    pattern (numpy.array): The MFCC pattern, one frame per row.
+
+    Returns:
+        numpy.array: The embedding of size 2 * number of coefficients.
+    """
+
+    return np.concatenate((pattern.mean(axis=0), pattern.std(axis=0)))
+
+
+def embed_windows(target_mfcc, window, step=1):
+    """ Embed every sliding window of the target MFCC pattern at once.
+
+    target_mfcc (numpy.array): The target MFCC pattern.
+    window (int): The number of frames of each window.
+    step (int, optional): Defaults to 1. The step between windows.
+
+    Returns:
+        numpy.array: One `embed()` of window per row.
+    """
+
+    zero = np.zeros((1, target_mfcc.shape[1]))
+    csum = np.vstack((zero, np.cumsum(target_mfcc, axis=0)))
+    csum_sq = np.vstack((zero, np.cumsum(np.square(target_mfcc), axis=0)))
+    starts = np.arange(0, len(target_mfcc) - window + 1, step)
+    mean = (csum[starts + window] - csum[starts]) / window
+    var = (csum_sq[starts + window] - csum_sq[starts]) / window - mean ** 2
+    return np.hstack((mean, np.sqrt(np.maximum(var, 0))))
+
+
+class PatternIndex():
+    """ The k-nearest-neighbor index of golden pattern embeddings. """
+
+    def __init__(self, names, lengths, windows, embeddings, scale):
+        """ Hold the built index. Use `build()` or `load()` to get one.
+
+        names (list): The names of golden patterns.
+        lengths (numpy.array): The number of frames of each pattern.
+        windows (numpy.array): The target window length used for each
+            pattern, the shortest length in its length bucket.
+        embeddings (numpy.array): The scaled embedding of each pattern.
+        scale (numpy.array): The scale dividing every embedding.
+        """
+
+        self.names = list(names)
+        self.lengths = np.asarray(lengths)
+        self.windows = np.asarray(windows)
+        self.embeddings = np.asarray(embeddings)
+        self.scale = np.asarray(scale)
+
+    @classmethod
+    def build(cls, golden_patterns, bucket=20):
+        """ Build the index of golden patterns.
+
+        golden_patterns (dict): The golden patterns with file name as key.
+        bucket (int, optional): Defaults to 20. The width in frames of the
+            length buckets. The patterns in one bucket share the target
+            windows.
+
+        Returns:
+            PatternIndex: The built index.
+        """
+
+        names = sorted(golden_patterns)
+        lengths = np.array([len(golden_patterns[n]) for n in names])
+        keys = lengths // bucket
+        windows = np.array([lengths[keys == key].min() for key in keys])
+        embeddings = np.array([embed(golden_patterns[n]) for n in names])
+        # Scale every dimension so that none of them dominates the distance.
+        scale = embeddings.std(axis=0) if len(names) > 1 \
+            else np.ones(embeddings.shape[1])
+        scale[scale == 0] = 1
+        return cls(names, lengths, windows, embeddings / scale, scale)
+
+    def matches(self, golden_patterns):
+        """ Check the index is built from the same golden patterns. """
+
+        if self.names != sorted(golden_patterns):
+            return False
+        embeddings = np.array([embed(golden_patterns[n]) for n in self.names])
+        return (np.array_equal(self.lengths, [len(golden_patterns[n])
+                                              for n in self.names])
+                and np.allclose(self.embeddings, embeddings / self.scale))
+
+    def shortlist(self, target_mfcc, k=3, step=5):
+        """ Get the names of the `k` golden patterns nearest to any window of
+            the target MFCC pattern.
+
+        target_mfcc (numpy.array): The target MFCC pattern.
+        k (int, optional): Defaults to 3. The number of candidates.
+        step (int, optional): Defaults to 5. The step between target windows.
+
+        Returns:
+            list: The names of candidates, the nearest first.
+        """
+
+        scores = np.full(len(self.names), np.inf)
+        for window in np.unique(self.windows):
+            if window > len(target_mfcc):
+                continue
+            idx = np.flatnonzero(self.windows == window)
+            embedded = embed_windows(target_mfcc, window, step) / self.scale
+            # The squared euclidean distance between every window and pattern.
+            dists = (np.sum(np.square(embedded), axis=1)[:, None]
+                     - 2 * embedded.dot(self.embeddings[idx].T)
+                     + np.sum(np.square(self.embeddings[idx]), axis=1))
+            scores[idx] = dists.min(axis=0)
+        # A pattern longer than the target cannot match at all.
+        scores[self.lengths > len(target_mfcc)] = np.inf
+        nearest = np.argsort(scores, kind='stable')[:k]
+        return [self.names[i] for i in nearest if np.isfinite(scores[i])]
+
+    def save(self, filepath):
+        """ Save the index as a .npz file. """
+
+        filepath = pathlib.Path(filepath)
+        # Write to a temporary file first so that the processes loading the
+        # index never see a half-written one. Each process has its own, since
+        # several of them may build the same index at once.
+        tmp = filepath.with_name('%s.%d.%d.tmp' % (
+            filepath.name, os.getpid(), threading.get_ident()))
+        try:
+            with tmp.open('wb') as npzfile:
+                np.savez(npzfile, names=np.array(self.names),
+                         lengths=self.lengths, windows=self.windows,
+                         embeddings=self.embeddings, scale=self.scale)
+            tmp.replace(filepath)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    @classmethod
+    def load(cls, filepath):
+        """ Load the index saved by `save()`. """
+
+        with np.load(str(filepath)) as npz:
+            return cls(npz['names'].tolist(), npz['lengths'], npz['windows'],
+                       npz['embeddings'], npz['scale'])
+
+    @classmethod
+    def load_or_build(cls, golden_patterns, folderpath='wav'):
+        """ Load the index saved alongside the golden patterns, or build and
+            save it if it does not exist or is out of date.
+
+        golden_patterns (dict): The golden patterns with file name as key.
+            The index of the patterns at each sample rate and feature mode is
+            saved in its own file.
+        folderpath (str, optional): Defaults to 'wav'. The relative folder
+            path (relative to this script) of the golden wavfiles, or the
+            cache of their features.
+
+        Returns:
+            PatternIndex: The index of `golden_patterns`.
+        """
+
+        filename = INDEX_FILENAME.replace('.npz', pattern_suffix(
+            getattr(golden_patterns, 'samplerate', 8000),
+            getattr(golden_patterns, 'features', 'mfcc')) + '.npz')
+        filepath = pathlib.Path(__file__).parent.joinpath(folderpath, filename)
+        try:
+            index = cls.load(filepath)
+            if index.matches(golden_patterns):
+                return index
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            # Not built yet or broken.
+            pass
+        index = cls.build(golden_patterns)
+        try:
+            index.save(filepath)
+        except OSError as err:
+            # E.g. the folder is read-only, build it again next time.
+            logging.getLogger(__name__).warning("Cannot save the index: %s",
+                                                err)
+        return index
@@ -0,0 +1,194 @@
+""" The opt-in profiling of batch runs across the worker processes.
+
+Within `profile()`, every worker process of `RunTelevid.run()`,
+`Televid.identify(multiproc=True)` and `Televid.identify_channels()` runs under
+cProfile and saves its stats when it finishes. On exit, the stats of the
+workers and of this process are merged into one pstats file, which can be
+loaded by `pstats` or rendered as a flame graph (e.g. by snakeviz or
+flameprof), and a summary of the stages and top hotspots is written beside it.
+Following is an example.
+
+    with profile('run.prof'):
+        RunTelevid('tests/data').run()
+    # run.prof and run.txt are written.
+
+The workers find the folder to save their stats in by an environment
+variable, so that it works with both forked and spawned processes.
+"""
+
+import contextlib
+import functools
+import io
+import itertools
+import logging
+import os
+import pathlib
+
+# The environment variable of the folder the workers save their stats in.
+PROFILE_DIR_ENV = 'TELEVID_PROFILE_DIR'
+
+# The functions of each stage, by (file name, function name).
+STAGES = {
+    'decode': ('televid.py', 'decode'),
+    'mfcc': ('base.py', 'mfcc'),
+    'fbank': ('base.py', 'fbank'),
+    'cmp_proc': ('televid.py', 'cmp_proc'),
+}
+
+# The running profiler and the pid of its process. A forked worker inherits
+# it and has to stop it before starting its own.
+_ACTIVE = None
+_COUNTER = itertools.count()
+
+
+@contextlib.contextmanager
+def profile(output, top=20):
+    """ Profile this process and every worker process started within.
+
+    output (str): The path of the merged pstats file. The summary is written
+        to the same path with the suffix `.txt`.
+    top (int, optional): Defaults to 20. The number of hotspots in the
+        summary.
+
+    Yields:
+        pathlib.Path: The folder the stats of workers are saved in.
+    """
+
+    import cProfile
+    import shutil
+    import tempfile
+    global _ACTIVE  # pylint: disable=global-statement
+
+    output = pathlib.Path(output)
+    folder = pathlib.Path(tempfile.mkdtemp(prefix='televid-profile-'))
+    previous = os.environ.get(PROFILE_DIR_ENV)
+    os.environ[PROFILE_DIR_ENV] = str(folder)
+    outer = _ACTIVE if _ACTIVE is not None and _ACTIVE[1] == os.getpid() \
+        else None
+    if outer is not None:
+        outer[0].disable()
+    profiler = cProfile.Profile()
+    _ACTIVE = (profiler, os.getpid())
+    profiler.enable()
+    try:
+        yield folder
+    finally:
+        profiler.disable()
+        _ACTIVE = outer
+        if outer is not None:
+            outer[0].enable()
+        if previous is None:
+            del os.environ[PROFILE_DIR_ENV]
+        else:
+            os.environ[PROFILE_DIR_ENV] = previous
+        try:
+            profiler.dump_stats(str(folder.joinpath('main.prof')))
+            stats = merge(folder.glob('*.prof'))
+            stats.dump_stats(str(output))
+            output.with_suffix('.txt').write_text(summary(stats, top))
+            logging.getLogger(__name__).info(
+                "Profile of %d processes saved to %s",
+                len(list(folder.glob('*.prof'))), output)
+        finally:
+            shutil.rmtree(str(folder), ignore_errors=True)
+
+
+def worker(func):
+    """ Decorate the target of a worker process, so that it runs under
+        cProfile and saves its stats if it is started within `profile()`.
+        Otherwise, it is called as is.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _ACTIVE  # pylint: disable=global-statement
+
+        folder = os.environ.get(PROFILE_DIR_ENV)
+        if folder is None or (_ACTIVE is not None
+                              and _ACTIVE[1] == os.getpid()):
+            # Not profiling, or already profiled in this process.
+            return func(*args, **kwargs)
+
+        import cProfile
+
+        if _ACTIVE is not None:
+            # Inherited from the parent by fork, its stats are the parent's.
+            _ACTIVE[0].disable()
+        profiler = cProfile.Profile()
+        _ACTIVE = (profiler, os.getpid())
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            _ACTIVE = None
+            profiler.dump_stats(os.path.join(folder, '%d-%d.prof' % (
+                os.getpid(), next(_COUNTER))))
+    return wrapper
+
+
+def merge(paths):
+    """ Merge the pstats files.
+
+    paths (iterable): The paths of pstats files.
+
+    Returns:
+        pstats.Stats: The merged stats.
+    """
+
+    import pstats
+
+    stats = None
+    for path in sorted(paths):
+        if stats is None:
+            stats = pstats.Stats(str(path), stream=io.StringIO())
+        else:
+            stats.add(str(path))
+    return stats
+
+
+def stage_times(stats):
+    """ Get the time spent in each stage of the stats.
+
+    stats (pstats.Stats): The profiled stats.
+
+    Returns:
+        dict: `(calls, cumulative seconds)` with stage name as key.
+    """
+
+    times = {stage: (0, 0.0) for stage in STAGES}
+    for (filename, _, funcname), (_, ncalls, _, cumtime, _) in \
+            stats.stats.items():
+        for stage, (stage_file, stage_func) in STAGES.items():
+            if (funcname == stage_func
+                    and os.path.basename(filename) == stage_file):
+                calls, seconds = times[stage]
+                times[stage] = (calls + ncalls, seconds + cumtime)
+    return times
+
+
+def summary(stats, top=20):
+    """ Summarize the stats by the stages and the top hotspots.
+
+    stats (pstats.Stats): The profiled stats.
+    top (int, optional): Defaults to 20. The number of hotspots.
+
+    Returns:
+        str: The readable summary.
+    """
+
+    import pstats
+
+    lines = ['Stages (cumulative time summed over processes)',
+             '%-10s%10s%14s' % ('stage', 'calls', 'seconds')]
+    for stage, (calls, seconds) in stage_times(stats).items():
+        lines.append('%-10s%10d%14.3f' % (stage, calls, seconds))
+    lines += ['', 'Top %d hotspots by own time (total %.3f seconds)'
+              % (top, stats.total_tt),
+              '%10s%12s%12s  %s' % ('calls', 'tottime', 'cumtime',
+                                    'function')]
+    hotspots = sorted(stats.stats.items(), key=lambda item: -item[1][2])
+    for func, (_, ncalls, tottime, cumtime, _) in hotspots[:top]:
+        lines.append('%10d%12.3f%12.3f  %s' % (
+            ncalls, tottime, cumtime, pstats.func_std_string(func)))
+    return '\n'.join(lines) + '\n'
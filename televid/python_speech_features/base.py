@@ -3,7 +3,6 @@
 from __future__ import division
 import numpy
 from . import sigproc
-from scipy.fftpack import dct
 
 
 def mfcc(signal, samplerate=16000, winlen=0.025, winstep=0.01, numcep=13,
@@ -11,7 +10,7 @@ def mfcc(signal, samplerate=16000, winlen=0.025, winstep=0.01, numcep=13,
          winfunc=lambda x: numpy.ones((x,))):
     """Compute MFCC features from an audio signal.
 
-    :param signal: the audio signal from which to compute features. Should be an N*1 array
+    :param signal: the audio signal from which to compute features. Should be an N*1 array, or a CHANNELS*N array to compute every channel at once
     :param samplerate: the samplerate of the signal we are working with.
     :param winlen: the length of the analysis window in seconds. Default is 0.025s (25 milliseconds)
     :param winstep: the step between successive windows in seconds. Default is 0.01s (10 milliseconds)
@@ -24,16 +23,18 @@ def mfcc(signal, samplerate=16000, winlen=0.025, winstep=0.01, numcep=13,
     :param ceplifter: apply a lifter to final cepstral coefficients. 0 is no lifter. Default is 22.
     :param appendEnergy: if this is true, the zeroth cepstral coefficient is replaced with the log of the total frame energy.
     :param winfunc: the analysis window to apply to each frame. By default no window is applied. You can use numpy window functions here e.g. winfunc=numpy.hamming
-    :returns: A numpy array of size (NUMFRAMES by numcep) containing features. Each row holds 1 feature vector.
+    :returns: A numpy array of size (NUMFRAMES by numcep) containing features. Each row holds 1 feature vector. For a CHANNELS*N signal, the size is (CHANNELS by NUMFRAMES by numcep).
     """
+    # Import scipy on first use since it is slow to import.
+    from scipy.fftpack import dct
     feat, energy = fbank(signal, samplerate, winlen, winstep,
                          nfilt, nfft, lowfreq, highfreq, preemph, winfunc)
     feat = numpy.log(feat)
-    feat = dct(feat, type=2, axis=1, norm='ortho')[:, :numcep]
+    feat = dct(feat, type=2, axis=-1, norm='ortho')[..., :numcep]
     feat = lifter(feat, ceplifter)
     if appendEnergy:
         # replace first cepstral coefficient with log of frame energy
-        feat[:, 0] = numpy.log(energy)
+        feat[..., 0] = numpy.log(energy)
     return feat
 
 
@@ -42,7 +43,7 @@ def fbank(signal, samplerate=16000, winlen=0.025, winstep=0.01,
           winfunc=lambda x: numpy.ones((x,))):
     """Compute Mel-filterbank energy features from an audio signal.
 
-    :param signal: the audio signal from which to compute features. Should be an N*1 array
+    :param signal: the audio signal from which to compute features. Should be an N*1 array, or a CHANNELS*N array to compute every channel at once
     :param samplerate: the samplerate of the signal we are working with.
     :param winlen: the length of the analysis window in seconds. Default is 0.025s (25 milliseconds)
     :param winstep: the step between successive windows in seconds. Default is 0.01s (10 milliseconds)
@@ -60,7 +61,7 @@ def fbank(signal, samplerate=16000, winlen=0.025, winstep=0.01,
     frames = sigproc.framesig(
         signal, winlen*samplerate, winstep*samplerate, winfunc)
     pspec = sigproc.powspec(frames, nfft)
-    energy = numpy.sum(pspec, 1)  # this stores the total energy in each frame
+    energy = numpy.sum(pspec, -1)  # this stores the total energy in each frame
     # if energy is zero, we get problems with log
     energy = numpy.where(energy == 0, numpy.finfo(float).eps, energy)
 
@@ -76,7 +77,7 @@ def logfbank(signal, samplerate=16000, winlen=0.025, winstep=0.01,
              nfilt=26, nfft=512, lowfreq=0, highfreq=None, preemph=0.97):
     """Compute log Mel-filterbank energy features from an audio signal.
 
-    :param signal: the audio signal from which to compute features. Should be an N*1 array
+    :param signal: the audio signal from which to compute features. Should be an N*1 array, or a CHANNELS*N array to compute every channel at once
     :param samplerate: the samplerate of the signal we are working with.
     :param winlen: the length of the analysis window in seconds. Default is 0.025s (25 milliseconds)
     :param winstep: the step between successive windows in seconds. Default is 0.01s (10 milliseconds)
@@ -182,7 +183,7 @@ def lifter(cepstra, L=22):
     :param L: the liftering coefficient to use. Default is 22. L <= 0 disables lifter.
     """
     if L > 0:
-        nframes, ncoeff = numpy.shape(cepstra)
+        ncoeff = numpy.shape(cepstra)[-1]
         n = numpy.arange(ncoeff)
         lift = 1 + (L/2.)*numpy.sin(numpy.pi*n/L)
         return lift*cepstra
@@ -194,19 +195,22 @@ def lifter(cepstra, L=22):
 def delta(feat, N):
     """Compute delta features from a feature vector sequence.
 
-    :param feat: A numpy array of size (NUMFRAMES by number of features) containing features. Each row holds 1 feature vector.
+    :param feat: A numpy array of size (NUMFRAMES by number of features) containing features. Each row holds 1 feature vector. For the features of every channel at once, the size is (CHANNELS by NUMFRAMES by number of features).
     :param N: For each frame, calculate delta features based on preceding and following N frames
-    :returns: A numpy array of size (NUMFRAMES by number of features) containing delta features. Each row holds 1 delta feature vector.
+    :returns: A numpy array of the same size as feat containing delta features. Each row holds 1 delta feature vector.
     """
     if N < 1:
         raise ValueError('N must be an integer >= 1')
-    NUMFRAMES = len(feat)
+    feat = numpy.asarray(feat)
+    NUMFRAMES = feat.shape[-2]
     denominator = 2 * sum(i**2 for i in range(1, N+1))
-    delta_feat = numpy.empty_like(feat)
-    # padded version of feat
-    padded = numpy.pad(feat, ((N, N), (0, 0)), mode='edge')
-    for t in range(NUMFRAMES):
-        # [t : t+2*N+1] == [(N+t)-N : (N+t)+N+1]
-        delta_feat[t] = numpy.dot(
-            numpy.arange(-N, N+1), padded[t: t+2*N+1]) / denominator
-    return delta_feat
+    # padded version of feat along the time axis
+    padded = numpy.pad(feat, [(0, 0)] * (feat.ndim - 2) + [(N, N), (0, 0)],
+                       mode='edge')
+    # Convolve with [-N, ..., N] over time as N shifted differences, instead
+    # of a dot product per frame.
+    delta_feat = numpy.zeros(feat.shape, dtype=numpy.result_type(feat, float))
+    for n in range(1, N+1):
+        delta_feat += n * (padded[..., N+n: N+n+NUMFRAMES, :] -
+                           padded[..., N-n: N-n+NUMFRAMES, :])
+    return delta_feat / denominator
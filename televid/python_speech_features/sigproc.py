@@ -15,20 +15,20 @@ def rolling_window(a, window, step=1):
     # http://ellisvalentiner.com/post/2017-03-21-np-strides-trick
     shape = a.shape[:-1] + (a.shape[-1] - window + 1, window)
     strides = a.strides + (a.strides[-1],)
-    return numpy.lib.stride_tricks.as_strided(a, shape=shape, strides=strides)[::step]
+    return numpy.lib.stride_tricks.as_strided(a, shape=shape, strides=strides)[..., ::step, :]
 
 
 def framesig(sig, frame_len, frame_step, winfunc=lambda x: numpy.ones((x,)), stride_trick=True):
     """Frame a signal into overlapping frames.
 
-    :param sig: the audio signal to frame.
+    :param sig: the audio signal to frame. The last axis is time, so a CHANNELS by N array frames every channel at once.
     :param frame_len: length of each frame measured in samples.
     :param frame_step: number of samples after the start of the previous frame that the next frame should begin.
     :param winfunc: the analysis window to apply to each frame. By default no window is applied.
     :param stride_trick: use stride trick to compute the rolling window and window multiplication faster
-    :returns: an array of frames. Size is NUMFRAMES by frame_len.
+    :returns: an array of frames. Size is NUMFRAMES by frame_len, or CHANNELS by NUMFRAMES by frame_len.
     """
-    slen = len(sig)
+    slen = numpy.shape(sig)[-1]
     frame_len = int(round_half_up(frame_len))
     frame_step = int(round_half_up(frame_step))
     if slen <= frame_len:
@@ -38,8 +38,8 @@ def framesig(sig, frame_len, frame_step, winfunc=lambda x: numpy.ones((x,)), str
 
     padlen = int((numframes - 1) * frame_step + frame_len)
 
-    zeros = numpy.zeros((padlen - slen,))
-    padsignal = numpy.concatenate((sig, zeros))
+    zeros = numpy.zeros(numpy.shape(sig)[:-1] + (padlen - slen,))
+    padsignal = numpy.concatenate((sig, zeros), axis=-1)
     if stride_trick:
         win = winfunc(frame_len)
         frames = rolling_window(padsignal, window=frame_len, step=frame_step)
@@ -47,7 +47,7 @@ def framesig(sig, frame_len, frame_step, winfunc=lambda x: numpy.ones((x,)), str
         indices = numpy.tile(numpy.arange(0, frame_len), (numframes, 1)) + numpy.tile(
             numpy.arange(0, numframes * frame_step, frame_step), (frame_len, 1)).T
         indices = numpy.array(indices, dtype=numpy.int32)
-        frames = padsignal[indices]
+        frames = padsignal[..., indices]
         win = numpy.tile(winfunc(frame_len), (numframes, 1))
 
     return frames * win
@@ -97,10 +97,10 @@ def magspec(frames, NFFT):
     :param NFFT: the FFT length to use. If NFFT > frame_len, the frames are zero-padded.
     :returns: If frames is an NxD matrix, output will be Nx(NFFT/2+1). Each row will be the magnitude spectrum of the corresponding frame.
     """
-    if numpy.shape(frames)[1] > NFFT:
+    if numpy.shape(frames)[-1] > NFFT:
         logging.warn(
             'frame length (%d) is greater than FFT size (%d), frame will be truncated. Increase NFFT to avoid.',
-            numpy.shape(frames)[1], NFFT)
+            numpy.shape(frames)[-1], NFFT)
     complex_spec = numpy.fft.rfft(frames, NFFT)
     return numpy.absolute(complex_spec)
 
@@ -135,8 +135,8 @@ def logpowspec(frames, NFFT, norm=1):
 def preemphasis(signal, coeff=0.95):
     """perform preemphasis on the input signal.
 
-    :param signal: The signal to filter.
+    :param signal: The signal to filter. The last axis is time.
     :param coeff: The preemphasis coefficient. 0 is no filter, default is 0.95.
     :returns: the filtered signal.
     """
-    return numpy.append(signal[0], signal[1:] - coeff * signal[:-1])
+    return numpy.concatenate((signal[..., :1], signal[..., 1:] - coeff * signal[..., :-1]), axis=-1)
@@ -0,0 +1,234 @@
+""" The reloadable registry of golden patterns, so that adding or updating a
+golden wavfile takes effect without deleting the pickle or restarting the
+processes using it.
+
+The registry holds a snapshot of golden patterns which is never modified once
+published. `reload()` stats every golden wavfile, computes the MFCC feature of
+the added and modified ones only, and publishes a new snapshot by swapping one
+reference. `Televid.identify()` takes the snapshot once at its start, so an
+identification in flight never sees a half-updated dict. Following is an
+example.
+
+    registry = PatternRegistry()
+    registry.watch()  # or call registry.reload() when the folder is updated
+    televoice = Televid(filepath, registry)
+"""
+
+import logging
+import os
+import pathlib
+import pickle
+import threading
+import time
+
+from .televid import (GoldenPatterns, Televid, extract_mfcc,
+                      golden_pickle_name, resample)
+
+
+class PatternRegistry():
+    """ Hold the latest golden patterns of a folder and reload them when the
+        golden wavfiles change.
+    """
+
+    def __init__(self, folderpath='wav', samplerate=8000, features='mfcc',
+                 cachepath=None):
+        """ Load the golden patterns, from the pickle if it is up to date.
+
+        folderpath (str, optional): Defaults to 'wav'. The relative folder
+            path (relative to this script) of the golden wavfiles.
+        samplerate (int, optional): Defaults to 8000. The sample rate of the
+            MFCC features, see `Televid.load_golden_patterns()`.
+        features (str, optional): Defaults to 'mfcc'. The feature mode, see
+            `Televid.load_golden_patterns()`.
+        cachepath (str, optional): Defaults to None. The folder path of the
+            pickle, see `Televid.load_golden_patterns()`.
+        """
+
+        self.folderpath = pathlib.Path(__file__).parent.joinpath(folderpath)
+        self.cachepath = (self.folderpath if cachepath is None else
+                          pathlib.Path(__file__).parent.joinpath(cachepath))
+        self.samplerate = samplerate
+        self.features = features
+        # Increased every time a new snapshot is published.
+        self.version = 0
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+        # The monotonic time of the last check of the golden folder.
+        self._checked = -float('inf')
+        self._patterns = Televid.load_golden_patterns(folderpath, samplerate,
+                                                      features, cachepath)
+        self.reload()
+
+    @property
+    def highfreq(self):
+        """ The highest band edge of the mel filters of the snapshot. """
+
+        return self._patterns.highfreq
+
+    def snapshot(self):
+        """ Get the latest golden patterns. The returned dict is never
+            modified, a reload publishes a new one instead.
+
+        Returns:
+            GoldenPatterns: Contains MFCC features with its file name as key.
+        """
+
+        return self._patterns
+
+    def reload(self, min_interval=0):
+        """ Compute the MFCC features of the added and modified golden
+            wavfiles, drop the removed ones and publish the new snapshot.
+
+            A wavfile which cannot be read (e.g. still being copied) keeps
+            its previous pattern and is retried on the next reload.
+
+        min_interval (float, optional): Defaults to 0. Skip the check if the
+            last one is less than this number of seconds ago, so that it can
+            be called before every classification without globbing the
+            folder each time.
+
+        Returns:
+            bool: Whether a new snapshot is published.
+        """
+
+        from scipy.io import wavfile
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked < min_interval:
+                return False
+            self._checked = now
+            current = self._patterns
+            sources = getattr(current, 'sources', {})
+            stats = dict()
+            for fpath in self.folderpath.glob('*.wav'):
+                try:
+                    stat = fpath.stat()
+                except FileNotFoundError:
+                    # Removed since globbed.
+                    continue
+                stats[fpath.stem] = (fpath, stat.st_mtime_ns, stat.st_size)
+            changed = [name for name, (_, mtime, size) in stats.items()
+                       if name not in current
+                       or sources.get(name, ())[:2] != (mtime, size)]
+            removed = set(current) - set(stats)
+            if not changed and not removed:
+                return False
+
+            new_sources = {name: sources[name] for name in stats
+                           if name in sources and name not in changed}
+            wavs = dict()
+            for name in changed:
+                fpath, mtime, size = stats[name]
+                try:
+                    wavs[name] = wavfile.read(fpath)
+                except (OSError, ValueError, EOFError) as err:
+                    logging.getLogger(__name__).warning(
+                        "Cannot read %s, keep the previous pattern: %s",
+                        fpath.name, err)
+                    if name in sources:
+                        new_sources[name] = sources[name]
+                    continue
+                new_sources[name] = (mtime, size, wavs[name][0])
+
+            # The band of every pattern is limited by the lowest rate, so all
+            # of them are recomputed if it changes.
+            lowest = min([src[2] for src in new_sources.values()] or [0])
+            highfreq = lowest / 2 if lowest < self.samplerate else None
+            if highfreq != current.highfreq:
+                for name in new_sources:
+                    if name not in wavs:
+                        wavs[name] = wavfile.read(stats[name][0])
+
+            patterns = GoldenPatterns(samplerate=self.samplerate,
+                                      highfreq=highfreq, sources=new_sources,
+                                      features=self.features)
+            for name in new_sources:
+                if name in wavs:
+                    rate, sig = wavs[name]
+                    if rate != self.samplerate:
+                        sig = resample(sig, rate, self.samplerate)
+                    patterns[name] = extract_mfcc(sig, self.samplerate,
+                                                  highfreq, self.features)
+                elif name in current:
+                    patterns[name] = current[name]
+            if patterns.keys() == current.keys() and not wavs:
+                return False
+
+            self._patterns = patterns
+            self.version += 1
+            self._save(patterns)
+            logging.getLogger(__name__).info(
+                "Golden patterns reloaded (version %d): %d updated, %d "
+                "removed.", self.version, len(wavs), len(removed))
+            return True
+
+    def watch(self, interval=1.0):
+        """ Reload periodically in a daemon thread until `stop()`.
+
+        interval (float, optional): Defaults to 1.0. The seconds between
+            checks of the golden folder.
+
+        Returns:
+            threading.Thread: The watching thread.
+        """
+
+        if self._thread is not None:
+            return self._thread
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, args=(interval,),
+                                        daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """ Stop the watching thread started by `watch()`. """
+
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception:  # pylint: disable=broad-except
+                logging.getLogger(__name__).exception("Reload failed.")
+
+    def _save(self, patterns):
+        """ Update the pickle so that a fresh `load_golden_patterns()` gets
+            the same patterns. It is replaced at once, never half-written.
+            Every process (e.g. each server worker) has its own registry
+            reloading on the same change, so each writes its own temporary
+            file. If it cannot be written, the published snapshot is kept
+            and only the pickle is stale.
+        """
+
+        filepath = self.cachepath.joinpath(
+            golden_pickle_name(self.samplerate, self.features))
+        tmp = filepath.with_name('%s.%d.%d.tmp' % (
+            filepath.name, os.getpid(), threading.get_ident()))
+        try:
+            self.cachepath.mkdir(parents=True, exist_ok=True)
+            with tmp.open('wb') as pfile:
+                pickle.dump(patterns, pfile, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp.replace(filepath)
+        except OSError as err:
+            logging.getLogger(__name__).warning(
+                "Cannot cache the golden patterns in %s: %s", self.cachepath,
+                err)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def __getstate__(self):
+        # The lock and the watching thread stay in this process.
+        state = self.__dict__.copy()
+        state.update(_lock=None, _stop=None, _thread=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
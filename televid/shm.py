@@ -0,0 +1,200 @@
+""" The shared-memory transport of MFCC arrays between processes.
+
+The arrays are placed once in a named shared memory block, and the views of
+them are `SharedArray`s, which are pickled as a lightweight `ArrayHandle`
+(name, shape, dtype and offset) instead of their content. Sending a view to
+another process through a queue or process arguments only sends its handle,
+and the receiver maps the same block. Following is an example.
+
+    with SharedArrays([target_mfcc, *golden_patterns.values()]) as block:
+        target_view, *pattern_views = block.arrays
+        ...  # send the views to the worker processes
+
+The process creating a block owns it and unlinks it by `close()`. Attaching
+to a block never registers it to the resource tracker, so a worker exiting
+never unlinks a block it does not own. The mapping of a block is closed when
+the last view of it is gone.
+
+A worker sends an array it created back by `transfer()`, whose receiver
+copies it out and unlinks the block when unpickled.
+"""
+
+import collections
+import copy
+import weakref
+
+import numpy as np
+
+
+# The location of an array in a shared memory block.
+ArrayHandle = collections.namedtuple('ArrayHandle',
+                                     ['name', 'shape', 'dtype', 'offset'])
+
+# The alignment of arrays in a block, in bytes.
+ALIGNMENT = 64
+
+# The blocks mapped in this process by name, so that the arrays of a block
+# share one mapping. Each view keeps its block alive.
+_BLOCKS = weakref.WeakValueDictionary()
+
+
+class SharedArray(np.ndarray):
+    """ The read-only view of an array in a shared memory block, pickled as
+        its handle. The arrays derived from it (slices, results of
+        operations) are pickled as plain arrays.
+    """
+
+    def __array_finalize__(self, obj):
+        # pylint: disable=attribute-defined-outside-init
+        self.handle = None
+        self.transferred = False
+        self._block = getattr(obj, '_block', None)
+
+    def __reduce__(self):
+        if self.handle is None:
+            return np.asarray(self).__reduce__()
+        if self.transferred:
+            return _take, (self.handle,)
+        return attach, (self.handle,)
+
+
+class SharedArrays():
+    """ The shared memory block holding a list of arrays, owned by the process
+        creating it.
+    """
+
+    def __init__(self, arrays):
+        """ Create the block and copy the arrays into it.
+
+        arrays (list): The numpy arrays.
+        """
+
+        from multiprocessing import shared_memory
+
+        arrays = [np.ascontiguousarray(array) for array in arrays]
+        offsets, size = [], 0
+        for array in arrays:
+            offsets.append(size)
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        _BLOCKS[self._shm.name] = self._shm
+        self.name = self._shm.name
+        self.arrays = []
+        for array, offset in zip(arrays, offsets):
+            handle = ArrayHandle(self.name, array.shape, array.dtype.str,
+                                 offset)
+            view = _view(self._shm, handle)
+            view.flags.writeable = True
+            view[...] = array
+            view.flags.writeable = False
+            self.arrays.append(view)
+
+    def close(self):
+        """ Unlink the block. The views still in use stay valid until they
+            are gone.
+        """
+
+        if self._shm is not None:
+            self._shm.unlink()
+            self._shm = None
+            self.arrays = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def share_patterns(golden_patterns):
+    """ Place the golden patterns in a new block.
+
+    golden_patterns (dict): The golden patterns with file name as key.
+
+    Returns:
+        tuple: (block, patterns), the `SharedArrays` to close by the caller
+            and the copy of `golden_patterns` holding the views.
+    """
+
+    block = SharedArrays(list(golden_patterns.values()))
+    patterns = copy.copy(golden_patterns)
+    patterns.update(zip(golden_patterns, block.arrays))
+    return block, patterns
+
+
+def attach(handle):
+    """ Get the view of an array in a shared memory block by its handle.
+
+    handle (ArrayHandle): The handle of array.
+
+    Returns:
+        SharedArray: The read-only view.
+    """
+
+    block = _BLOCKS.get(handle.name)
+    if block is None:
+        block = _open(handle.name, track=False)
+        _BLOCKS[handle.name] = block
+    return _view(block, handle)
+
+
+def transfer(array):
+    """ Copy the array into a new block whose ownership goes to the process
+        receiving it. The receiver gets a plain copy when the returned array
+        is unpickled and unlinks the block. The block is unlinked by the
+        resource tracker at exit if it is never received.
+
+    array (numpy.array): The array to send.
+
+    Returns:
+        SharedArray: The array to send instead.
+    """
+
+    view = SharedArrays([array]).arrays[0]
+    view.transferred = True
+    return view
+
+
+def _take(handle):
+    """ Copy out the transferred array and unlink its block. """
+
+    block = _open(handle.name, track=True)
+    try:
+        array = np.ndarray(handle.shape, handle.dtype, buffer=block.buf,
+                           offset=handle.offset).copy()
+    finally:
+        block.close()
+        block.unlink()
+    return array
+
+
+def _view(block, handle):
+    view = np.ndarray(handle.shape, handle.dtype, buffer=block.buf,
+                      offset=handle.offset).view(SharedArray)
+    view.handle = handle
+    # pylint: disable=protected-access
+    view._block = block
+    view.flags.writeable = False
+    return view
+
+
+def _open(name, track):
+    """ Map the existing block. An untracked block is never unlinked by the
+        resource tracker of this process.
+    """
+
+    from multiprocessing import resource_tracker, shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name, track=track)
+    except TypeError:
+        # Before Python 3.13, every SharedMemory is tracked.
+        pass
+    if track:
+        return shared_memory.SharedMemory(name)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name)
+    finally:
+        resource_tracker.register = register
@@ -15,22 +15,413 @@ Post-Processing:
     Return the result of comparison
 """
 
+import copy
 import io
 import math
-import multiprocessing as mp
 import logging
+import os
 import pathlib
 import pickle
+import queue as queue_module
+import subprocess
 import time
 
 import numpy as np
-from scipy.io import wavfile
-import ffmpeg
 
-from .python_speech_features import mfcc
+from . import profiling
+from .python_speech_features import delta, mfcc
 
+# The heavy modules, `multiprocessing`, `ffmpeg` and `scipy.io.wavfile`, are
+# imported on first use in the functions which need them, keeping `import
+# televid` fast for short-lived processes.
 
-logging.basicConfig(level=logging.INFO)
+
+# The output format of target audio after decoded by FFmpeg:
+#    sample rate    8000 Hz
+#    bit depth      16
+#    channels       mono (left channel only, since the target channel is
+#                         the left one)
+FFMPEG_OUTPUT_OPTIONS = {'format': 'wav', 'af': 'pan=mono|c0=c0', 'ar': 8000,
+                         'sample_fmt': 's16'}
+
+# The sample rates the target audio can be matched at, narrowband and
+# wideband telephony. The golden patterns are computed for each of them.
+SUPPORTED_RATES = (8000, 16000)
+
+# The frame length and step of MFCC features in seconds. The number of frames
+# per second is the same at every sample rate, so the differences are on the
+# same scale.
+WINLEN = 0.025
+WINSTEP = 0.01
+
+# The feature modes: the static MFCCs only, or followed by their deltas
+# (computed over `DELTA_N` frames on each side), which are more robust to the
+# distortion of a channel.
+FEATURES = ('mfcc', 'mfcc+delta')
+DELTA_N = 2
+
+# The values of `stop_flag`. When the threshold is reached, the unfinished
+# comparisons are discarded; when cancelled or timed out, the best difference
+# found so far by each comparison is kept.
+STOP_THRESHOLD = 1
+STOP_CANCEL = 2
+
+# The seconds a worker process has to finish after its deadline before it is
+# terminated.
+JOIN_GRACE = 1.0
+
+# The result type when no golden pattern is compared to any window, e.g. the
+# time is over before the first window or the worker is terminated.
+UNKNOWN_TYPE = 'unknown'
+
+
+def ffmpeg_stream(source, all_channels=False, samplerate=8000):
+    """ Build the FFmpeg stream converting (normalizing) the target audio into
+        the format of `FFMPEG_OUTPUT_OPTIONS` and writing it to stdout.
+
+    source (str or bytes): The path of target file, or the content of target
+        file which will be fed through stdin.
+    all_channels (bool, optional): Defaults to False. If set True, keep every
+        channel instead of the left one only.
+    samplerate (int, optional): Defaults to 8000. The output sample rate. If
+        set None, the native sample rate is kept.
+
+    Returns:
+        ffmpeg.nodes.OutputStream: The stream to `run()` or `compile()`.
+    """
+
+    import ffmpeg
+
+    options = dict(FFMPEG_OUTPUT_OPTIONS)
+    if all_channels:
+        del options['af']
+    if samplerate is None:
+        del options['ar']
+    else:
+        options['ar'] = samplerate
+    stdin = isinstance(source, (bytes, bytearray, memoryview))
+    return (
+        ffmpeg
+        .input('pipe:' if stdin else str(source))
+        .output('-', **options)
+        .overwrite_output()
+    )
+
+
+def decode(source, all_channels=False, samplerate=8000, timeout=None):
+    """ Call the FFmpeg to decode the target audio.
+
+    source (str or bytes): The path of target file, or the content of target
+        file.
+    all_channels (bool, optional): Defaults to False. If set True, decode
+        every channel in the same pass.
+    samplerate (int, optional): Defaults to 8000. The sample rate to decode
+        at. If set None, the audio at one of `SUPPORTED_RATES` keeps its
+        native rate, and the others are resampled by `supported_rate()`.
+    timeout (float, optional): Defaults to None. The seconds FFmpeg may take,
+        after which it is killed.
+
+    Raise:
+        ffmpeg.Error: FFmpeg returns a nonzero exit code.
+        TimeoutError: FFmpeg does not finish in `timeout`.
+
+    Returns:
+        tuple: (rate, signal). The signal is an (N, channels) array if
+            `all_channels` is set True and the audio has multiple channels.
+    """
+
+    # Following is the method to call ffmpeg as subprocess.
+    # try:
+    #     proc = subprocess.run(['ffmpeg', '-y', '-hide_banner',
+    #                            '-loglevel', 'panic',
+    #                            '-i', str(self.filepath),
+    #                            '-af', 'pan=mono|c0=c0',
+    #                            '-ar', '8000',
+    #                            '-sample_fmt', 's16',
+    #                            '-f', 'wav',
+    #                            '-'], stdout=subprocess.PIPE)
+    # except FileNotFoundError:
+    #     logging.getLogger(__name__).error("Require ffmpeg to convert the"
+    #                                       "audio in sepcific format.")
+    #     sys.exit(2)  # FFmpeg require
+
+    # The following method is to call ffmpeg as pip3 installed python-ffmpeg
+    # module.
+    import ffmpeg
+
+    stdin = isinstance(source, (bytes, bytearray, memoryview))
+    proc = (
+        ffmpeg_stream(source, all_channels, samplerate)
+        .run_async(pipe_stdin=stdin, pipe_stdout=True, pipe_stderr=True)
+    )
+    try:
+        stdout, err = proc.communicate(bytes(source) if stdin else None,
+                                       timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        raise TimeoutError('ffmpeg does not finish in %.1f seconds' % timeout)
+    except BaseException:
+        # Do not leave FFmpeg running if interrupted, e.g. KeyboardInterrupt.
+        proc.kill()
+        proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', stdout, err)
+
+    logging.getLogger(__name__).debug(err)
+    rate, signal = read_wav_stdout(stdout)
+    if samplerate is None and rate not in SUPPORTED_RATES:
+        signal = resample(signal, rate, supported_rate(rate))
+        rate = supported_rate(rate)
+    return rate, signal
+
+
+def supported_rate(rate):
+    """ Get the supported sample rate to match the audio of `rate` at, the
+        highest one not above it, or the lowest one if `rate` is below all.
+    """
+
+    return max([r for r in SUPPORTED_RATES if r <= rate]
+               or [min(SUPPORTED_RATES)])
+
+
+def resample(signal, rate, samplerate):
+    """ Resample the signal (along the first axis) from `rate` to
+        `samplerate` by polyphase filtering, keeping its dtype.
+    """
+
+    from scipy.signal import resample_poly
+
+    gcd = math.gcd(int(rate), int(samplerate))
+    return resample_poly(signal, samplerate // gcd, rate // gcd,
+                         axis=0).astype(signal.dtype)
+
+
+def feature_params(samplerate, highfreq=None):
+    """ Get the MFCC parameters of `samplerate`. The frames are `WINLEN`
+        and `WINSTEP` seconds at every rate, so the FFT size grows with the
+        samples per frame, and the filterbank spans up to `highfreq`.
+
+    samplerate (int): The sample rate of signal.
+    highfreq (float, optional): Defaults to None. The highest band edge of
+        the mel filters. If set None, it is samplerate / 2.
+
+    Returns:
+        dict: The keyword arguments of `mfcc()`.
+    """
+
+    nfft = max(512, 2 ** math.ceil(math.log2(WINLEN * samplerate)))
+    return {'samplerate': samplerate, 'winlen': WINLEN, 'winstep': WINSTEP,
+            'nfft': nfft, 'highfreq': highfreq, 'appendEnergy': False}
+
+
+def extract_mfcc(signal, samplerate, highfreq=None, features='mfcc'):
+    """ Get the MFCC feature of the signal, the same way as the golden
+        patterns. The last axis of `signal` is time, see `mfcc()`.
+
+    features (str, optional): Defaults to 'mfcc'. One of `FEATURES`. For
+        'mfcc+delta', the deltas follow the MFCCs of each frame.
+
+    Raise:
+        ValueError: Unknown features.
+    """
+
+    if features not in FEATURES:
+        raise ValueError('unknown features: %s' % features)
+    feat = mfcc(signal, **feature_params(samplerate, highfreq))
+    if features == 'mfcc+delta':
+        feat = np.concatenate((feat, delta(feat, DELTA_N)), axis=-1)
+    return feat
+
+
+def extract_target(signal, samplerate, golden_patterns):
+    """ Get the feature of the target signal, the same way as the golden
+        patterns it is compared with.
+    """
+
+    return extract_mfcc(signal, samplerate,
+                        getattr(golden_patterns, 'highfreq', None),
+                        getattr(golden_patterns, 'features', 'mfcc'))
+
+
+def remaining_time(deadline):
+    """ Get the seconds left until the `time.time()` deadline, None if
+        there is no deadline.
+    """
+
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0)
+
+
+def collect_results(mp_queue, procs, deadline=None, on_deadline=None,
+                    poll=0.1, grace=JOIN_GRACE):
+    """ Get the result of each worker process from the queue, as they arrive,
+        without hanging on a worker which exits without one. The workers are
+        joined when done.
+
+    mp_queue (multiprocessing.Queue): The queue every worker puts one result.
+    procs (list): The started `multiprocessing.Process` instances.
+    deadline (float, optional): Defaults to None. The `time.time()` after
+        which `on_deadline` is called. The workers still running `grace`
+        seconds later are terminated.
+    on_deadline (callable, optional): Defaults to None. Signal the workers to
+        stop, e.g. set the `stop_flag`.
+    poll (float, optional): Defaults to 0.1. The seconds between liveness
+        checks.
+    grace (float, optional): Defaults to `JOIN_GRACE`. The seconds the
+        workers have to finish after the deadline.
+
+    Yields:
+        The result of each worker. The results of the workers which exited
+            without one (e.g. crashed or terminated) are missing.
+    """
+
+    received = 0
+    signalled = False
+    idle = False
+    try:
+        while received < len(procs):
+            try:
+                item = mp_queue.get(timeout=poll)
+            except queue_module.Empty:
+                now = time.time()
+                if deadline is not None and now > deadline:
+                    if not signalled and on_deadline is not None:
+                        on_deadline()
+                    signalled = True
+                    if now > deadline + grace:
+                        for proc in procs:
+                            if proc.is_alive():
+                                proc.terminate()
+                if not any(proc.is_alive() for proc in procs):
+                    # Poll once more for the results written just before the
+                    # last worker exited.
+                    if idle:
+                        logging.getLogger(__name__).warning(
+                            "%d worker(s) exited without a result.",
+                            len(procs) - received)
+                        return
+                    idle = True
+                continue
+            received += 1
+            yield item
+    finally:
+        for proc in procs:
+            proc.join(grace)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+
+
+def select_golden_patterns(golden_patterns, rate):
+    """ Get the golden patterns to match the target audio of `rate` with.
+
+    golden_patterns (dict): The golden patterns with file name as key, or
+        the ones of each sample rate with rate as key, as loaded by
+        `Televid.load_golden_patterns_per_rate()`. Either of them can be a
+        `PatternRegistry` instead.
+    rate (int): The sample rate of target audio.
+
+    Raise:
+        ValueError: No golden patterns are computed at `rate`.
+
+    Returns:
+        dict: The golden patterns with file name as key, or the registry.
+    """
+
+    if hasattr(golden_patterns, 'snapshot'):
+        # A `PatternRegistry`, whose snapshot is taken by `identify()`.
+        if golden_patterns.samplerate != rate:
+            raise ValueError('golden patterns are at %d Hz but target is at '
+                             '%d Hz' % (golden_patterns.samplerate, rate))
+        return golden_patterns
+    if golden_patterns and all(isinstance(key, int) for key in golden_patterns):
+        if rate not in golden_patterns:
+            raise ValueError('no golden patterns at %d Hz' % rate)
+        return golden_patterns[rate]
+    # A plain dict is the old pickle computed at 8000 Hz.
+    if getattr(golden_patterns, 'samplerate', 8000) != rate:
+        raise ValueError('golden patterns are at %d Hz but target is at %d Hz'
+                         % (getattr(golden_patterns, 'samplerate', 8000), rate))
+    return golden_patterns
+
+
+def pattern_suffix(samplerate, features='mfcc'):
+    """ Get the suffix of the files caching the golden patterns (and their
+        index) of `samplerate` and `features`, empty for the default ones.
+    """
+
+    return (('' if samplerate == 8000 else '_%d' % samplerate)
+            + ('_delta' if features == 'mfcc+delta' else ''))
+
+
+def golden_pickle_name(samplerate, features='mfcc'):
+    """ Get the file name of the pickle caching the golden patterns at
+        `samplerate`.
+    """
+
+    return 'golden_ptns%s.pkl' % pattern_suffix(samplerate, features)
+
+
+class GoldenPatterns(dict):
+    """ The golden patterns with file name as key, computed at `samplerate`.
+
+    The mel filterbank spans up to `highfreq` (None for samplerate / 2),
+    which is the Nyquist frequency of the golden wavfiles if they are
+    upsampled, and the target audio is featured the same way. The `sources`
+    are the `(mtime_ns, size, rate)` of each golden wavfile when its pattern
+    was computed, for `PatternRegistry.reload()`. The `features` is one of
+    `FEATURES`.
+    """
+
+    # The pickles of the old versions have the MFCCs only.
+    features = 'mfcc'
+
+    def __init__(self, *args, samplerate=8000, highfreq=None, sources=None,
+                 features='mfcc', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.samplerate = samplerate
+        self.highfreq = highfreq
+        self.sources = dict(sources or {})
+        self.features = features
+
+
+def read_wav_stdout(stdout):
+    """ Read the wav content written to stdout by FFmpeg.
+
+    When the output of FFmpeg is sent to stdout, the program does not fill in
+    the RIFF chunk size of the file header. Instead, the four bytes where the
+    chunk size should be are all 0xFF. scipy.io.wavfile.read() expects that
+    value to be correct, so it thinks the length of the chunk is 0xFFFFFFFF
+    bytes. Hence, we need to patch the RIFF chunk size manually before the
+    data is passed to wavfile.read() via an io.BytesIO() object.
+
+    stdout (bytes): The wav content.
+
+    Returns:
+        tuple: (rate, signal)
+    """
+
+    # This is the size of the entire file in bytes minus 8 bytes for the two
+    # fields not included in this count: ChunkID and ChunkSize.
+    riff_chunk_size = len(stdout) - 8
+    quotient = riff_chunk_size
+
+    # Break up the chunk size into four bytes, held in b.
+    binarray = list()
+    for _ in range(4):
+        quotient, remainder = divmod(quotient, 256)  # every 8 bits
+        binarray.append(remainder)
+
+    # Replace bytes 4:8 in stdout with the actual size of the RIFF
+    # chunk.
+    riff = stdout[:4] + bytes(binarray) + stdout[8:]
+
+    # Read the target wave file.
+    from scipy.io import wavfile
+    return wavfile.read(io.BytesIO(riff))
 
 
 class Televid():
@@ -38,7 +429,8 @@ class Televid():
         audio wavfiles.
     """
 
-    def __init__(self, filepath, golden_patterns):
+    def __init__(self, filepath, golden_patterns, classifier=None,
+                 samplerate=8000, timeout=None):
         """ Build the telecomvoice identification object and do the
             pre-processing.
 
@@ -48,84 +440,138 @@ class Televid():
             3. Get the MFCC pattern of target file
 
         filepath (str): The path of target file (to be compared).
+        golden_patterns (dict): The golden patterns with file name as key,
+            or the ones of each sample rate with rate as key. A
+            `PatternRegistry` can be given instead of the dict, and each
+            `identify()` uses its latest snapshot.
+        classifier (DiffsClassifier, optional): Defaults to None. The trained
+            classifier deciding `result_type`. If set None, the hand-tuned
+            thresholds are used.
+        samplerate (int, optional): Defaults to 8000. The sample rate to match
+            at. If set None, the native rate of the target file is used, see
+            `decode()`.
+        timeout (float, optional): Defaults to None. The seconds decoding the
+            target file may take.
+
+        Raise:
+            FileNotFoundError: Cannot find the target file located in filepath.
+            ValueError: No golden patterns are at the sample rate.
+            TimeoutError: Decoding does not finish in `timeout`.
+        """
+
+        filepath = pathlib.Path(filepath)
+        if not filepath.exists():
+            raise FileNotFoundError('not such file: %s' % str(filepath))
+        rate, signal = decode(filepath, samplerate=samplerate, timeout=timeout)
+        golden_patterns = select_golden_patterns(golden_patterns, rate)
+        # Get the MFCC feature of target wavfile.
+        self._setup(filepath, golden_patterns,
+                    extract_target(signal, rate, golden_patterns),
+                    classifier, samplerate=rate)
+
+    @classmethod
+    def from_signal(cls, signal, rate, golden_patterns, filepath='',
+                    classifier=None):
+        """ Build the telecomvoice identification object from the already
+            decoded target signal instead of a file.
+
+        signal (numpy.array): The mono target signal.
+        rate (int): The sample rate of `signal`.
+        golden_patterns (dict): The golden patterns with file name as key,
+            or the ones of each sample rate with rate as key.
+        filepath (str, optional): Defaults to ''. The path or name of target
+            which is only used for reporting (e.g. `is_correct`).
+        classifier (DiffsClassifier, optional): Defaults to None. The trained
+            classifier deciding `result_type`.
+
+        Returns:
+            Televid: The object ready for `identify()`.
+        """
+
+        golden_patterns = select_golden_patterns(golden_patterns, rate)
+        televoice = cls.__new__(cls)
+        televoice._setup(pathlib.Path(filepath), golden_patterns,
+                         extract_target(signal, rate, golden_patterns),
+                         classifier, samplerate=rate)
+        return televoice
+
+    @classmethod
+    def from_channels(cls, filepath, golden_patterns, classifier=None,
+                      samplerate=8000, timeout=None):
+        """ Build one telecomvoice identification object for each channel of
+            the target file, e.g. both call legs of a stereo recording. Every
+            channel is decoded in one FFmpeg pass and their MFCC features are
+            computed in one batched call.
+
+        filepath (str): The path of target file (to be compared).
+        golden_patterns (dict): The golden patterns with file name as key,
+            or the ones of each sample rate with rate as key.
+        classifier (DiffsClassifier, optional): Defaults to None. The trained
+            classifier deciding `result_type`.
+        samplerate (int, optional): Defaults to 8000. The sample rate to match
+            at. If set None, the native rate of the target file is used.
+        timeout (float, optional): Defaults to None. The seconds decoding the
+            target file may take.
 
         Raise:
             FileNotFoundError: Cannot find the target file located in filepath.
+            ValueError: No golden patterns are at the sample rate.
+            TimeoutError: Decoding does not finish in `timeout`.
+
+        Returns:
+            list: The Televid objects, the one of channel `i` at index `i`.
+                Their `channel` is the channel index.
         """
 
-        self.filepath = pathlib.Path(filepath)
-        if not self.filepath.exists():
-            raise FileNotFoundError('not such file: %s' % str(self.filepath))
-        # Contain the golden patterns with its file name as key.
+        filepath = pathlib.Path(filepath)
+        if not filepath.exists():
+            raise FileNotFoundError('not such file: %s' % str(filepath))
+        rate, signal = decode(filepath, all_channels=True,
+                              samplerate=samplerate, timeout=timeout)
+        golden_patterns = select_golden_patterns(golden_patterns, rate)
+        if signal.ndim == 1:
+            signal = signal[:, np.newaxis]
+        televoices = []
+        for channel, target_mfcc in enumerate(
+                extract_target(signal.T, rate, golden_patterns)):
+            televoice = cls.__new__(cls)
+            televoice._setup(filepath, golden_patterns, target_mfcc,
+                             classifier, channel, rate)
+            televoices.append(televoice)
+        return televoices
+
+    def _setup(self, filepath, golden_patterns, target_mfcc, classifier,
+               channel=None, samplerate=8000):
+        self.filepath = filepath
+        # The channel index of target audio, None for the left channel only.
+        self.channel = channel
+        # The sample rate the target audio is matched at.
+        self.samplerate = samplerate
+        # Contain the golden patterns with its file name as key, or the
+        # `PatternRegistry` of them.
         self.golden_patterns = golden_patterns
+        self.classifier = classifier
         self.diffs = dict()
+        # The start (in seconds) of the best matching window of each golden
+        # pattern, None if it is not compared to the end, and the duration of
+        # each golden pattern in seconds.
+        self.offsets = dict()
+        self.durations = dict()
+        # The difference at every scanned window of each golden pattern, only
+        # if requested by `identify(curves=True)`.
+        self.curves = dict()
         self.identify_time = None
         self.threshold = None
         self.scan_step = None
+        # The `time.time()` the comparisons must stop at, and whether the last
+        # identification is cancelled or timed out with partial differences.
+        self.deadline = None
+        self.timed_out = False
+        self.target_mfcc = target_mfcc
 
-        # Call the ffmpeg to convert (normalize) the input audio into:
-        #    sample rate    8000 Hz
-        #    bit depth      16
-        #    channels       mono (left channel only, since the target channel is
-        #                         the left one)
-
-        # Following is the method to call ffmpeg as subprocess.
-        # try:
-        #     proc = subprocess.run(['ffmpeg', '-y', '-hide_banner',
-        #                            '-loglevel', 'panic',
-        #                            '-i', str(self.filepath),
-        #                            '-af', 'pan=mono|c0=c0',
-        #                            '-ar', '8000',
-        #                            '-sample_fmt', 's16',
-        #                            '-f', 'wav',
-        #                            '-'], stdout=subprocess.PIPE)
-        # except FileNotFoundError:
-        #     logging.getLogger(__name__).error("Require ffmpeg to convert the"
-        #                                       "audio in sepcific format.")
-        #     sys.exit(2)  # FFmpeg require
-
-        # The following method is to call ffmpeg as pip3 installed python-ffmpeg
-        # module.
-        stdout, err = (
-            ffmpeg
-            .input(str(self.filepath))
-            .output('-', format='wav', af='pan=mono|c0=c0', ar=8000, sample_fmt='s16')
-            .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True)
-        )
-
-        logging.getLogger(__name__).debug(err)
-
-        # When the output of FFmpeg is sent to stdout, the program does not fill
-        # in the RIFF chunk size of the file header. Instead, the four bytes
-        # where the chunk size should be are all 0xFF. scipy.io.wavfile.read()
-        # expects that value to be correct, so it thinks the length of the chunk
-        # is 0xFFFFFFFF bytes. Hence, we need to patch the RIFF chunk size
-        # manually before the data is passed to wavfile.read() via an
-        # io.BytesIO() object.
-
-        # This is the size of the entire file in bytes minus 8 bytes for the two
-        # fields not included in this count: ChunkID and ChunkSize.
-        riff_chunk_size = len(stdout) - 8
-        quotient = riff_chunk_size
-
-        # Break up the chunk size into four bytes, held in b.
-        binarray = list()
-        for _ in range(4):
-            quotient, remainder = divmod(quotient, 256)  # every 8 bits
-            binarray.append(remainder)
-
-        # Replace bytes 4:8 in stdout with the actual size of the RIFF
-        # chunk.
-        riff = stdout[:4] + bytes(binarray) + stdout[8:]
-
-        # Read the target wave file.
-        rate, signal = wavfile.read(io.BytesIO(riff))
-
-        # Get the MFCC feature of target wavfile.
-        self.target_mfcc = mfcc(signal, rate, appendEnergy=False)
-
-    def identify(self, threshold=None, scan_step=1, multiproc=False):
+    def identify(self, threshold=None, scan_step=1, multiproc=False,
+                 stop_flag=None, index=None, shortlist=3, confidence=None,
+                 curves=False, timeout=None, shared_memory=False):
         """ Compare the MFCC patterns differences. Return a dict containing all
             differences.
 
@@ -135,68 +581,286 @@ class Televid():
             frame of target MFCC pattern.
         multiproc (bool, optional): Defaults to False. Enable the
             multiprocessing for each golden patterns comparison.
+        stop_flag (multiprocessing.Value, optional): Defaults to None. The
+            flag shared with the caller, setting its `value` nonzero stops the
+            comparison. Setting it `STOP_CANCEL` cancels the identification
+            keeping the best differences so far. A new one is created if not
+            given.
+        index (PatternIndex, optional): Defaults to None. If given, only the
+            golden patterns shortlisted by the index are compared, and only
+            those are in the returned differences.
+        shortlist (int, optional): Defaults to 3. The number of golden
+            patterns shortlisted by `index`.
+        confidence (float, optional): Defaults to None. If set and there is a
+            `classifier`, the sequential comparison stops as soon as the
+            classifier is this confident of the differences compared so far.
+        curves (bool, optional): Defaults to False. If set True, keep the
+            difference at every scanned window in `curves` for
+            `top_offsets()`.
+        timeout (float, optional): Defaults to None. The seconds the
+            comparison may take. When it is over, every comparison stops with
+            its best difference so far and `timed_out` is set True.
+        shared_memory (bool, optional): Defaults to False. If set True, the
+            target and golden MFCC patterns are placed in shared memory once
+            for the worker processes of `multiproc`, instead of being copied
+            to each of them (see `televid.shm`).
+
+        Raise:
+            RuntimeError: A comparison fails in a worker process.
 
         Returns:
             dict: A dictionary of differences between each golden pattern.
         """
 
+        import multiprocessing as mp
+
         start_time = time.time()
         self.threshold = threshold
         self.scan_step = scan_step
+        self.deadline = None if timeout is None else start_time + timeout
 
         # The stop flag is to signal all the cmp_proc to stop since the result
-        # of one of them is smaller than the threshold. This is used in both
-        # sequential and parallel comparisons because it's shared memory object.
-        stop_flag = mp.Value('H', 0)
+        # of one of them is smaller than the threshold, or the identification
+        # is cancelled. This is used in both sequential and parallel
+        # comparisons because it's shared memory object.
+        if stop_flag is None:
+            stop_flag = mp.Value('H', 0)
+
+        # Take the snapshot of a registry once, so that a reload meanwhile
+        # never mixes two versions of golden patterns in one identification.
+        snapshot = (self.golden_patterns.snapshot()
+                    if hasattr(self.golden_patterns, 'snapshot')
+                    else self.golden_patterns)
+        if index is None:
+            golden_patterns = snapshot
+        else:
+            # Fall back to every golden pattern if none can be shortlisted,
+            # e.g. the target is shorter than all of them. The index may be
+            # older than the snapshot, so the removed patterns are skipped.
+            golden_patterns = {name: snapshot[name] for name in
+                               index.shortlist(self.target_mfcc, shortlist)
+                               if name in snapshot} or snapshot
 
         if not multiproc:
             # Sequential comparison
-            for name, ptn in self.golden_patterns.items():
-                self.diffs.update(self.cmp_proc(name, ptn, stop_flag))
+            for name, ptn in golden_patterns.items():
+                if stop_flag.value == STOP_CANCEL:
+                    break
+                self.diffs.update(self.cmp_proc(name, ptn, stop_flag,
+                                                curve=curves))
+                if (confidence and self.classifier is not None and
+                        self.classifier.predict_proba([self.diffs]).max()
+                        >= confidence):
+                    break
         else:
             # Multiprocessing parallel comparison
             # The queue for outputs of multiprocessing
             queue = mp.Queue()
-            # The flag to stop the process from running if set 1
-            procs = [mp.Process(target=self.cmp_proc,
-                                args=(*i,
-                                      stop_flag,
-                                      queue))
-                     for i in self.golden_patterns.items()]
-            for proc in procs:
-                proc.start()
-            for _ in procs:
-                self.diffs.update(queue.get())
+            # The copy sent to the workers, without the golden patterns they
+            # get one by one.
+            worker = copy.copy(self)
+            worker.golden_patterns = None
+            worker.classifier = None
+            block = None
+            if shared_memory:
+                from .shm import SharedArrays
+                block = SharedArrays([self.target_mfcc,
+                                      *golden_patterns.values()])
+                worker.target_mfcc, *views = block.arrays
+                golden_patterns = dict(zip(golden_patterns, views))
+            try:
+                procs = [mp.Process(target=worker._cmp_child,
+                                    args=(*i,
+                                          stop_flag,
+                                          queue,
+                                          curves))
+                         for i in golden_patterns.items()]
+                for proc in procs:
+                    proc.start()
+
+                def cancel():
+                    stop_flag.value = STOP_CANCEL
+
+                for item in collect_results(queue, procs, self.deadline,
+                                            cancel):
+                    if isinstance(item, Exception):
+                        # Stop the peers, which are joined by
+                        # collect_results().
+                        cancel()
+                        raise item
+                    res, offset, duration, curve = item
+                    self.diffs.update(res)
+                    name = next(iter(res))
+                    self.offsets[name] = offset
+                    self.durations[name] = duration
+                    if curve is not None:
+                        self.curves[name] = curve
+            finally:
+                if block is not None:
+                    block.close()
+        self.timed_out = stop_flag.value == STOP_CANCEL
         self.identify_time = time.time() - start_time
         return self.diffs
 
-    def cmp_proc(self, name, golden_pattern, stop_flag, mp_queue=None):
-        """ The procedure for one golden pattern.
+    @staticmethod
+    def identify_channels(televoices, threshold=None, scan_step=1,
+                          multiproc=True, curves=False, timeout=None,
+                          deadline=None, grace=JOIN_GRACE):
+        """ Identify the Televid objects of every channel (see
+            `from_channels()`) independently.
+
+        televoices (list): The Televid objects of channels.
+        threshold (int, optional): Defaults to None. The threshold for the
+            least difference to stop the comparison of a channel.
+        scan_step (int, optional): Defaults to 1. The step of scanning on
+            frame of target MFCC pattern.
+        multiproc (bool, optional): Defaults to True. Identify each channel in
+            a process of its own.
+        curves (bool, optional): Defaults to False. Keep the difference
+            curves, see `identify()`.
+        timeout (float, optional): Defaults to None. The seconds all the
+            channels may take together, see `identify()`. A channel process
+            not finishing in time is terminated and its differences stay
+            empty.
+        deadline (float, optional): Defaults to None. The `time.time()` by
+            which every channel stops, instead of `timeout`, e.g. the one of
+            the whole file. Each channel gets what is left of it when it
+            starts.
+        grace (float, optional): Defaults to `JOIN_GRACE`. The seconds the
+            channel processes have to finish after the deadline, before they
+            are terminated.
+
+        Raise:
+            RuntimeError: The identification fails in a channel process.
+
+        Returns:
+            list: The same objects as `televoices`, identified.
+        """
+
+        import multiprocessing as mp
+
+        if deadline is None and timeout is not None:
+            deadline = time.time() + timeout
+        if not multiproc or len(televoices) <= 1:
+            for televoice in televoices:
+                televoice.identify(threshold=threshold, scan_step=scan_step,
+                                   curves=curves,
+                                   timeout=remaining_time(deadline))
+            return televoices
+
+        queue = mp.Queue()
+        procs = [mp.Process(target=televoice._identify_proc,
+                            args=(idx, queue, threshold, scan_step, curves,
+                                  deadline))
+                 for idx, televoice in enumerate(televoices)]
+        for proc in procs:
+            proc.start()
+        # Every channel stops by itself at the deadline, this only bounds the
+        # ones which do not.
+        received = set()
+        for idx, result in collect_results(queue, procs, deadline,
+                                           grace=grace):
+            if isinstance(result, Exception):
+                raise result
+            received.add(idx)
+            televoices[idx].diffs.update(result['diffs'])
+            televoices[idx].offsets.update(result['offsets'])
+            televoices[idx].durations.update(result['durations'])
+            televoices[idx].curves.update(result['curves'])
+            televoices[idx].identify_time = result['identify_time']
+            televoices[idx].timed_out = result['timed_out']
+            televoices[idx].threshold = threshold
+            televoices[idx].scan_step = scan_step
+        for idx, televoice in enumerate(televoices):
+            # Terminated at the deadline, or crashed, without a result.
+            if idx not in received:
+                televoice.timed_out = True
+        return televoices
+
+    @profiling.worker
+    def _identify_proc(self, idx, mp_queue, threshold, scan_step, curves,
+                       deadline):
+        """ Identify in a child process and send the result, or the error,
+            back.
+        """
+
+        try:
+            self.identify(threshold=threshold, scan_step=scan_step,
+                          curves=curves, timeout=remaining_time(deadline))
+        except Exception as err:  # pylint: disable=broad-except
+            mp_queue.put((idx, RuntimeError('channel %d: %s: %s' % (
+                idx, type(err).__name__, err))))
+            return
+        mp_queue.put((idx, {'diffs': self.diffs, 'offsets': self.offsets,
+                            'durations': self.durations,
+                            'curves': self.curves,
+                            'timed_out': self.timed_out,
+                            'identify_time': self.identify_time}))
+
+    @profiling.worker
+    def _cmp_child(self, name, golden_pattern, stop_flag, mp_queue, curve):
+        """ Run `cmp_proc()` in a child process, sending the error instead of
+            the result if it fails, so that the parent never waits for it.
+        """
+
+        try:
+            self.cmp_proc(name, golden_pattern, stop_flag, mp_queue, curve)
+        except Exception as err:  # pylint: disable=broad-except
+            mp_queue.put(RuntimeError('%s: %s: %s' % (
+                name, type(err).__name__, err)))
+
+    def cmp_proc(self, name, golden_pattern, stop_flag, mp_queue=None,
+                 curve=False):
+        """ The procedure for one golden pattern. The offset of the best
+            matching window is kept in `offsets`, and the difference of every
+            window in `curves` if `curve` is set.
 
         Args:
             name (str): The name of the golden pattern.
             golden_pattern (numpy.array): The MFCC feature of the golden
                 pattern.
             stop_flag (multiprocessing.Value): If set nonzero, this function
-                will be stopped for reaching the condition of `threshold`.
+                will be stopped for reaching the condition of `threshold`, or
+                cancelled if it is `STOP_CANCEL`. It is set `STOP_CANCEL`
+                when `deadline` is over.
             mp_queue (multiprocessing.Queue, optional): Defaults to None.
                 The `Queue` instance for getting the result (diff) by
-                multiprocessing `Process()`.
+                multiprocessing `Process()`. The result is sent with the
+                offset, duration and curve as a tuple.
+            curve (bool, optional): Defaults to False. Keep the difference of
+                every scanned window.
 
         Returns:
             dict: A dictionary contains only one item which key is the name
                 and data is the difference value.
         """
 
+        # Match on plain arrays, since every slice and result of a shared
+        # memory view is a `SharedArray` whose finalizing costs in this loop.
+        target_mfcc = np.asarray(self.target_mfcc)
+        golden_pattern = np.asarray(golden_pattern)
         window = len(golden_pattern)
         diff = math.inf
-        if len(self.target_mfcc) >= window:
-            for i in range(0, len(self.target_mfcc) - window + 1, self.scan_step):
+        best = None
+        dists = [] if curve else None
+        if len(target_mfcc) >= window:
+            for i in range(0, len(target_mfcc) - window + 1, self.scan_step):
+                if (self.deadline is not None and stop_flag.value == 0
+                        and time.time() > self.deadline):
+                    stop_flag.value = STOP_CANCEL
+                if stop_flag.value == STOP_CANCEL:
+                    # Keep the best so far.
+                    break
                 if stop_flag.value != 0:
                     diff = math.inf
+                    best = None
                     break
-                diff_arr = self.target_mfcc[i:i + window] - golden_pattern
-                diff = min(sum(np.power(diff_arr, 2).flat), diff)
+                diff_arr = target_mfcc[i:i + window] - golden_pattern
+                dist = sum(np.power(diff_arr, 2).flat)
+                if dists is not None:
+                    dists.append(dist / window)
+                if dist < diff:
+                    diff, best = dist, i
                 if self.threshold and diff / window < self.threshold:
                     stop_flag.value = 1
                     break
@@ -205,10 +869,71 @@ class Televid():
                                                 "%s since it's shorter than"
                                                 "target MFCC.")
         res = {name: diff / window}
+        # The frames are `WINSTEP` seconds apart at every sample rate.
+        self.offsets[name] = None if best is None else best * WINSTEP
+        self.durations[name] = window * WINSTEP
+        if dists is not None:
+            self.curves[name] = np.array(dists)
         if mp_queue is not None:
-            mp_queue.put(res)
+            mp_queue.put((res, self.offsets[name], self.durations[name],
+                          self.curves.get(name)))
         return res
 
+    def top_offsets(self, name=None, k=3):
+        """ Get the `k` best matching windows of a golden pattern from its
+            difference curve. The windows are at least the pattern duration
+            apart, so that each of them is a distinct occurrence.
+
+        name (str, optional): Defaults to None. The name of the golden
+            pattern. If set None, it is the matched one.
+        k (int, optional): Defaults to 3. The number of windows.
+
+        Raise:
+            ValueError: The curve is not kept, see `identify(curves=True)`.
+
+        Returns:
+            list: The `(offset, difference)` tuples, the best first, where the
+                offset is the start of window in seconds.
+        """
+
+        if name is None:
+            name = min(self.diffs, key=self.diffs.get)
+        if name not in self.curves:
+            raise ValueError('no curve of %s, identify with curves=True' % name)
+        curve = self.curves[name]
+        # The index of curve is in scanned steps, not frames.
+        gap = max(int(round(self.durations[name] /
+                            (WINSTEP * self.scan_step))), 1)
+        taken = []
+        for idx in np.argsort(curve, kind='stable').tolist():
+            if len(taken) >= k:
+                break
+            if all(abs(idx - other) >= gap for other in taken):
+                taken.append(idx)
+        return [(idx * self.scan_step * WINSTEP, float(curve[idx]))
+                for idx in taken]
+
+    def match_region(self, name=None):
+        """ Get where the golden pattern matches in the target audio.
+
+        name (str, optional): Defaults to None. The name of the golden
+            pattern. If set None, it is the matched one.
+
+        Returns:
+            tuple: (start, end) in seconds, or None if it is not compared to
+                the end.
+        """
+
+        if name is None:
+            if not self.has_result:
+                return None
+            # The original name, which matched_pattern() lowercases.
+            name = min(self.diffs, key=self.diffs.get)
+        if self.offsets.get(name) is None:
+            return None
+        return (self.offsets[name],
+                self.offsets[name] + self.durations[name])
+
     def matched_pattern(self, diff_value=False):
         """ Get which golden pattern is the matched one.
 
@@ -219,8 +944,12 @@ class Televid():
             str: The name of matched pattern. If `diff_value` is set True, the
                 rtype will be a tuple as following:
                 (matched_pattern_name, matched_pattern_value).
+                The name is None (and the value inf) if there is no finite
+                difference, see `has_result`.
         """
 
+        if not self.has_result:
+            return (None, np.inf) if diff_value else None
         if diff_value:
             return (min(self.diffs, key=self.diffs.get).lower(),
                     min(self.diffs.values()))
@@ -228,18 +957,34 @@ class Televid():
 
     @property
     def mrd(self):
-        """ Get the maximum difference among difference indice. """
+        """ Get the maximum difference among difference indice. It is nan
+            if there is no finite difference.
+        """
+        if not self.has_result:
+            return np.nan
         return max(self.diffs.values()) - min(self.diffs.values())
 
+    @property
+    def has_result(self):
+        """ Check any golden pattern is compared to a window, so that the
+            differences tell the result. It is False if the comparisons are
+            stopped (e.g. timed out) before any window.
+        """
+        return any(np.isfinite(diff) for diff in self.diffs.values())
+
     @property
     def result_type(self):
         """ Check the type of result, which returns the full lowercase string.
-            The default typical detect conditions is set by trail and error in
-            following settings:
+            If there is a `classifier`, the result is predicted by it.
+            Otherwise, the default typical detect conditions is set by trail
+            and error in following settings:
             (threshold=1500, scan_step=3) or (threshold=None, scan_step=1)
-
-        TODO: This can be optimized by machine learning classifier.
+            It is `UNKNOWN_TYPE` if there is no result, see `has_result`.
         """
+        if not self.has_result:
+            return UNKNOWN_TYPE
+        if self.classifier is not None:
+            return self.classifier.predict([self.diffs])[0]
         if self.mrd < 2000 and self.matched_pattern(True)[1] > 2000:
             return 'typical'
         return ''.join(self.matched_pattern(True)[0].split('_')[:2]).lower()
@@ -252,47 +997,116 @@ class Televid():
         return self.filepath.name[:2] == self.result_type[:2]
 
     @staticmethod
-    def load_golden_patterns(folderpath='wav'):
-        """ Load every wavfile in folderpath and generate its MFCC feature.
+    def load_golden_patterns(folderpath='wav', samplerate=8000,
+                             features='mfcc', cachepath=None):
+        """ Load every wavfile in folderpath and generate its MFCC feature at
+            `samplerate`.
 
             If there exists a pickle, load it instead. Returns a dict()
             containing MFCC features with its file name as key.
 
+            The wavfiles at another sample rate are resampled. If any of them
+            is upsampled, the mel filterbank of every pattern spans up to its
+            Nyquist frequency only, since there is nothing above it.
+
         folderpath (str, optional): Defaults to 'wav'. The relative folder
             path (relative to this script) of the golden wavfiles.
+        samplerate (int, optional): Defaults to 8000. The sample rate of the
+            MFCC features, one of `SUPPORTED_RATES`. The patterns of each
+            rate are cached in their own pickle.
+        features (str, optional): Defaults to 'mfcc'. One of `FEATURES`. The
+            patterns of each mode are cached in their own pickle, so the
+            deltas are computed once, and the target audio compared with them
+            is featured the same way.
+        cachepath (str, optional): Defaults to None. The relative folder path
+            (relative to this script) of the pickles, created if missing. If
+            set None, it is `folderpath`. If the pickle cannot be written
+            (e.g. the folder is read-only), the patterns are not cached.
+
+        Raise:
+            ValueError: Unknown features.
 
         Returns:
-            dict: Contains MFCC features with its file name as key.
+            GoldenPatterns: Contains MFCC features with its file name as key.
         """
 
+        from scipy.io import wavfile
+
+        if features not in FEATURES:
+            raise ValueError('unknown features: %s' % features)
         folderpath = pathlib.Path(__file__).parent.joinpath(folderpath)
+        cachepath = (folderpath if cachepath is None else
+                     pathlib.Path(__file__).parent.joinpath(cachepath))
+        pklname = golden_pickle_name(samplerate, features)
 
         # Keep trying to open the pickle file if an error occurs.
         while True:
             try:
-                with folderpath.joinpath('golden_ptns.pkl').open('rb') as pfile:
+                with cachepath.joinpath(pklname).open('rb') as pfile:
                     golden_patterns = pickle.load(pfile)
+                if not isinstance(golden_patterns, GoldenPatterns):
+                    # The pickle of the old version, computed at 8000 Hz.
+                    golden_patterns = GoldenPatterns(golden_patterns)
                 return golden_patterns
             except FileNotFoundError:
                 # The pickle file does not exist.
                 # Get MFCC feature from golden wavfiles.
-                golden_patterns = dict()
+                wavs, sources = dict(), dict()
                 for fpath in folderpath.glob('*.wav'):
-                    (rate, sig) = wavfile.read(fpath)
-                    golden_patterns[fpath.stem] = mfcc(sig, rate,
-                                                       appendEnergy=False)
-                # Save the pickle.
-                with folderpath.joinpath('golden_ptns.pkl').open('wb') as pfile:
-                    pickle.dump(golden_patterns, pfile,
-                                protocol=pickle.HIGHEST_PROTOCOL)
+                    stat = fpath.stat()
+                    wavs[fpath.stem] = wavfile.read(fpath)
+                    sources[fpath.stem] = (stat.st_mtime_ns, stat.st_size,
+                                           wavs[fpath.stem][0])
+                lowest = min([rate for rate, _ in wavs.values()] or [0])
+                highfreq = lowest / 2 if lowest < samplerate else None
+                golden_patterns = GoldenPatterns(samplerate=samplerate,
+                                                 highfreq=highfreq,
+                                                 sources=sources,
+                                                 features=features)
+                for name, (rate, sig) in wavs.items():
+                    if rate != samplerate:
+                        sig = resample(sig, rate, samplerate)
+                    golden_patterns[name] = extract_mfcc(sig, samplerate,
+                                                         highfreq, features)
+                # Save the pickle, through a temporary file of this process
+                # so that the others never load a half-written one.
+                filepath = cachepath.joinpath(pklname)
+                tmp = filepath.with_name('%s.%d.tmp' % (pklname, os.getpid()))
+                try:
+                    cachepath.mkdir(parents=True, exist_ok=True)
+                    with tmp.open('wb') as pfile:
+                        pickle.dump(golden_patterns, pfile,
+                                    protocol=pickle.HIGHEST_PROTOCOL)
+                    tmp.replace(filepath)
+                except OSError as err:
+                    logging.getLogger(__name__).warning(
+                        "Cannot cache the golden patterns in %s: %s",
+                        cachepath, err)
+                finally:
+                    if tmp.exists():
+                        tmp.unlink()
                 return golden_patterns
             except EOFError:
                 # The pickle file created but binary content haven't been
                 # written in.
-                logging.getLogger(__name__).warning("Load golden_ptns.pkl"
-                                                    "but is empty, retrying..")
+                logging.getLogger(__name__).warning("Load %s but is empty, "
+                                                    "retrying..", pklname)
                 continue
             except pickle.UnpicklingError as err:
-                logging.getLogger(__name__).warning("Load golden_ptns.pkl"
-                                                    "but %s, retrying..", err)
+                logging.getLogger(__name__).warning("Load %s but %s, "
+                                                    "retrying..", pklname, err)
                 continue
+
+    @staticmethod
+    def load_golden_patterns_per_rate(folderpath='wav', features='mfcc',
+                                      cachepath=None):
+        """ Load the golden patterns at each of `SUPPORTED_RATES`, for
+            matching the target audio at its native rate.
+
+        Returns:
+            dict: The golden patterns with sample rate as key.
+        """
+
+        return {rate: Televid.load_golden_patterns(folderpath, rate, features,
+                                                   cachepath)
+                for rate in SUPPORTED_RATES}
@@ -0,0 +1,411 @@
+""" Streaming sinks for the results of `Televid`. Unlike
+`RunTelevid.save_results()` which can only be called after every file has been
+identified, the writers here append each result as soon as it arrives and
+flush periodically, so a crashed run loses at most the unflushed tail.
+
+Every writer remembers which target files and channels are already present
+in its output (`written`), which is used for resuming an interrupted run.
+
+Writers:
+    CsvResultWriter     The readable results, same columns as `save_results()`
+                        plus the full path and channel of target file and
+                        whether it is timed out.
+    JsonlDatasetWriter  The `(diffs, result_type)` dataset in JSON Lines.
+    NpzDatasetWriter    The same dataset in columnar .npz parts.
+
+A timed out result keeps the best differences so far (see `Televid.identify()`)
+and is marked by `timed_out` in every output, so it can be told from a full
+one. Its result type is `unknown` if nothing is compared at all.
+
+The outputs of the shards of a run (see `televid.discovery`) are combined by
+`merge_outputs()`.
+"""
+
+import csv
+import json
+import logging
+import math
+import pathlib
+import pickle
+import time
+
+import numpy as np
+
+
+CSV_HEADER = ('Path', 'Channel', 'Name', 'Matched', 'Difference',
+              'Max Result Difference', 'Result Type', 'Is Correct',
+              'Identify Time', 'Timed Out')
+
+
+def result_fields(result):
+    """ Get the readable fields of an identified `Televid`.
+
+    Args:
+        result (Televid): A Televid instance which has already identified.
+
+    Returns:
+        tuple: (name, matched, difference, mrd, result_type, is_correct,
+            identify_time)
+    """
+
+    return (result.filepath.name, *result.matched_pattern(True), result.mrd,
+            result.result_type, result.is_correct, result.identify_time)
+
+
+def json_safe(value):
+    """ Replace the non-finite floats (e.g. the inf differences of the
+        comparisons stopped by `threshold`) in the value by None, since they
+        are not valid JSON.
+
+    value: The JSON-like value of dicts, lists, tuples and scalars.
+
+    Returns:
+        The value which `json.dumps(value, allow_nan=False)` accepts.
+    """
+
+    if isinstance(value, dict):
+        return {key: json_safe(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(val) for val in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+class StreamWriter():
+    """ The base class of append-only writers. Subclasses implement
+        `_load_written()`, `_open()`, `_write()` and `_flush()`.
+    """
+
+    def __init__(self, path, resume=False, flush_every=100,
+                 flush_interval=5.0):
+        """ Open the output for appending.
+
+        path (str): The output path.
+        resume (bool, optional): Defaults to False. If set True, keep the
+            existing output and remember which files are already in it.
+            Otherwise, the existing output is overwritten.
+        flush_every (int, optional): Defaults to 100. Flush after this number
+            of buffered results.
+        flush_interval (float, optional): Defaults to 5.0. Flush if the last
+            flush is older than this number of seconds.
+        """
+
+        self.path = pathlib.Path(path)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        # The `(path string, channel)` of the results already in the output,
+        # including those written since opened. The channel is None for the
+        # left channel only.
+        self.written = self._load_written() if resume else set()
+        self._pending = 0
+        self._last_flush = time.time()
+        self._open(resume)
+
+    def write(self, result):
+        """ Append one identified `Televid` and flush if it is time to. """
+
+        self._write(result)
+        self.written.add((str(result.filepath), result.channel))
+        self._pending += 1
+        if (self._pending >= self.flush_every
+                or time.time() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """ Flush the buffered results to the output. """
+
+        if self._pending:
+            self._flush()
+        self._pending = 0
+        self._last_flush = time.time()
+
+    def close(self):
+        """ Flush and close the output. """
+
+        self.flush()
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_written(self):
+        raise NotImplementedError
+
+    def _open(self, resume):
+        raise NotImplementedError
+
+    def _write(self, result):
+        raise NotImplementedError
+
+    def _flush(self):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class _LineWriter(StreamWriter):
+    """ The common part of writers producing one text line per result. """
+
+    def _open(self, resume):
+        if resume and self.path.exists():
+            _truncate_partial_line(self.path)
+            self._file = self.path.open('a', newline='')
+        else:
+            self._file = self.path.open('w', newline='')
+            self._write_header()
+
+    def _write_header(self):
+        pass
+
+    def _flush(self):
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class CsvResultWriter(_LineWriter):
+    """ Append the readable results as a csv file. """
+
+    def _load_written(self):
+        if not self.path.exists():
+            return set()
+        with self.path.open(newline='') as csvfile:
+            return {(row[0], int(row[1]) if row[1] else None)
+                    for row in csv.reader(csvfile)
+                    if len(row) == len(CSV_HEADER) and row[0] != CSV_HEADER[0]}
+
+    def _write_header(self):
+        csv.writer(self._file).writerow(CSV_HEADER)
+
+    def _write(self, result):
+        csv.writer(self._file).writerow((str(result.filepath), result.channel,
+                                         *result_fields(result),
+                                         result.timed_out))
+
+
+class JsonlDatasetWriter(_LineWriter):
+    """ Append the MFCC training dataset as JSON Lines. Each line is an object
+        with `path`, `channel`, `diffs`, `result_type` and `timed_out`. The
+        infinite differences are null.
+    """
+
+    def _load_written(self):
+        return {(record['path'], record.get('channel'))
+                for record in _read_jsonl(self.path)}
+
+    def _write(self, result):
+        self._file.write(json.dumps(json_safe({
+            'path': str(result.filepath), 'channel': result.channel,
+            'diffs': result.diffs, 'result_type': result.result_type,
+            'timed_out': result.timed_out}), allow_nan=False))
+        self._file.write('\n')
+
+
+class NpzDatasetWriter(StreamWriter):
+    """ Write the MFCC training dataset as columnar .npz parts in a folder.
+        Every flush writes one `part-XXXXX.npz` containing the arrays `paths`,
+        `channels` (-1 for the left channel only), `names` (golden pattern
+        names), `diffs` (one row per path, one column per name),
+        `result_types` and `timed_out`.
+    """
+
+    def _load_written(self):
+        written = set()
+        for part in sorted(self.path.glob('part-*.npz')):
+            with np.load(part) as npz:
+                written.update(
+                    (path, None if channel == -1 else channel)
+                    for path, channel in zip(npz['paths'].tolist(),
+                                             npz['channels'].tolist()))
+        return written
+
+    def _open(self, resume):
+        self.path.mkdir(parents=True, exist_ok=True)
+        parts = sorted(self.path.glob('part-*.npz'))
+        if not resume:
+            for part in parts:
+                part.unlink()
+            parts = []
+        self._nparts = len(parts)
+        self._rows = []
+
+    def _write(self, result):
+        self._rows.append((str(result.filepath),
+                           -1 if result.channel is None else result.channel,
+                           result.diffs, result.result_type,
+                           result.timed_out))
+
+    def _flush(self):
+        paths, channels, diffs, result_types, timed_out = zip(*self._rows)
+        names = sorted(set().union(*diffs))
+        part = self.path.joinpath('part-%05d.npz' % self._nparts)
+        # Write to a temporary file first so that a crash never leaves a
+        # truncated part behind.
+        tmp = part.with_suffix('.tmp')
+        with tmp.open('wb') as npzfile:
+            np.savez(npzfile,
+                     paths=np.array(paths),
+                     channels=np.array(channels),
+                     names=np.array(names),
+                     diffs=np.array([[d.get(n, np.inf) for n in names]
+                                     for d in diffs], dtype=float),
+                     result_types=np.array(result_types),
+                     timed_out=np.array(timed_out, dtype=bool))
+        tmp.replace(part)
+        self._nparts += 1
+        self._rows = []
+
+
+def load_dataset(path):
+    """ Load the MFCC training dataset generated by
+        `RunTelevid.save_mfcc_training_dataset()`, `JsonlDatasetWriter` or
+        `NpzDatasetWriter`.
+
+    path (str): The path of `dataset.pkl`, the .jsonl file or the folder of
+        .npz parts.
+
+    Returns:
+        list: A list of `(diffs, result_type)` tuples.
+    """
+
+    path = pathlib.Path(path)
+    if path.is_dir():
+        return [(dict(zip(names, row)), result_type)
+                for _, names, diffs, result_types in _read_npz_parts(path)
+                for row, result_type in zip(diffs.tolist(), result_types)]
+    if path.suffix == '.pkl':
+        with path.open('rb') as pfile:
+            return pickle.load(pfile)
+    return [({name: np.inf if diff is None else diff
+              for name, diff in record['diffs'].items()},
+             record['result_type'])
+            for record in _read_jsonl(path)]
+
+
+def merge_outputs(sources, output):
+    """ Merge the outputs of the same writer type, e.g. written by the shards
+        of a run, into one. A target file (path and channel) in several
+        sources is kept once, from the first source.
+
+    sources (list): The paths of the .csv files, the .jsonl files or the
+        folders of .npz parts.
+    output (str): The path of merged output, of the same type as sources.
+
+    Raise:
+        ValueError: The sources are of different types.
+
+    Returns:
+        int: The number of rows in the merged output.
+    """
+
+    sources = [pathlib.Path(source) for source in sources]
+    output = pathlib.Path(output)
+    kinds = {'npz' if source.is_dir() else source.suffix for source in sources}
+    if len(kinds) > 1:
+        raise ValueError('cannot merge different outputs: %s'
+                         % ', '.join(sorted(kinds)))
+    seen = set()
+
+    def unseen(key):
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    if kinds == {'npz'}:
+        output.mkdir(parents=True, exist_ok=True)
+        for part in output.glob('part-*.npz'):
+            part.unlink()
+        nparts = 0
+        for source in sources:
+            for part in sorted(source.glob('part-*.npz')):
+                with np.load(part) as npz:
+                    # Keep the columns of the part, only drop the duplicates.
+                    keep = [unseen(key) for key in zip(
+                        npz['paths'].tolist(), npz['channels'].tolist())]
+                    if not any(keep):
+                        continue
+                    tmp = output.joinpath('part-%05d.tmp' % nparts)
+                    with tmp.open('wb') as npzfile:
+                        # The parts written before `timed_out` was added
+                        # lack it.
+                        np.savez(npzfile, names=npz['names'],
+                                 **{key: npz[key][keep] for key in (
+                                     'paths', 'channels', 'diffs',
+                                     'result_types', 'timed_out')
+                                    if key in npz.files})
+                    tmp.replace(tmp.with_suffix('.npz'))
+                    nparts += 1
+        return len(seen)
+
+    tmp = output.with_name(output.name + '.tmp')
+    with tmp.open('w', newline='') as outfile:
+        if kinds == {'.csv'}:
+            csvwriter = csv.writer(outfile)
+            csvwriter.writerow(CSV_HEADER)
+            for source in sources:
+                with source.open(newline='') as csvfile:
+                    for row in csv.reader(csvfile):
+                        if (len(row) == len(CSV_HEADER)
+                                and row[0] != CSV_HEADER[0]
+                                and unseen((row[0], row[1]))):
+                            csvwriter.writerow(row)
+        else:
+            for source in sources:
+                for record in _read_jsonl(source):
+                    if unseen((record['path'], record['channel'])):
+                        outfile.write(json.dumps(json_safe(record),
+                                                 allow_nan=False))
+                        outfile.write('\n')
+    tmp.replace(output)
+    return len(seen)
+
+
+def _read_jsonl(path):
+    if not path.exists():
+        return
+    with path.open() as jsonlfile:
+        for line in jsonlfile:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # The last line may be cut off by a crash.
+                logging.getLogger(__name__).warning("Skip broken line in %s",
+                                                    path)
+
+
+def _read_npz_parts(path):
+    for part in sorted(path.glob('part-*.npz')):
+        with np.load(part) as npz:
+            yield (npz['paths'].tolist(), npz['names'].tolist(), npz['diffs'],
+                   npz['result_types'].tolist())
+
+
+def _truncate_partial_line(path):
+    """ Cut off the unfinished last line left by a crash, so the appended
+        lines start on a line of their own.
+    """
+
+    with path.open('rb+') as bfile:
+        end = bfile.seek(0, 2)
+        pos = end
+        # Scan backward block by block for the last newline.
+        while pos > 0:
+            start = max(pos - 4096, 0)
+            bfile.seek(start)
+            block = bfile.read(pos - start)
+            idx = block.rfind(b'\n')
+            if idx != -1:
+                pos = start + idx + 1
+                break
+            pos = start
+        if pos != end:
+            bfile.truncate(pos)
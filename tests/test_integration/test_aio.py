@@ -0,0 +1,50 @@
+import asyncio
+import concurrent.futures
+import pathlib
+import unittest
+
+from televid import Televid
+from televid.aio import AsyncTelevid, classify_async
+
+
+class TestAsyncTelevid(unittest.TestCase):
+    def test_classify_path(self):
+        televoice = asyncio.run(classify_async('tests/data/inbusy.mp3',
+                                               Televid.load_golden_patterns(),
+                                               threshold=1500, scan_step=3))
+        self.assertEqual(televoice.result_type, 'inbusy')
+        self.assertEqual(televoice.filepath.name, 'inbusy.mp3')
+
+    def test_classify_bytes(self):
+        content = pathlib.Path('tests/data/voicemail_c.mp3').read_bytes()
+        televoice = asyncio.run(classify_async(content, threshold=1500,
+                                               scan_step=3))
+        self.assertEqual(televoice.result_type, 'voicemail')
+
+    def test_concurrency_with_process_executor(self):
+        names = ('inbusy.mp3', 'noresponse_a.mp3', 'voicemail_d_1.mp3')
+
+        async def classify_all():
+            with concurrent.futures.ProcessPoolExecutor(2) as executor:
+                classifier = AsyncTelevid(executor=executor, max_concurrency=2)
+                return await asyncio.gather(*(
+                    classifier.classify('tests/data/' + name, threshold=1500,
+                                        scan_step=3)
+                    for name in names))
+
+        results = asyncio.run(classify_all())
+        self.assertEqual([r.result_type for r in results],
+                         ['inbusy', 'noresponse', 'voicemail'])
+        # The worker registry is not sent back with the results.
+        self.assertEqual([r.golden_patterns for r in results], [None] * 3)
+
+    def test_cancel(self):
+        async def cancel():
+            task = asyncio.ensure_future(AsyncTelevid().classify(
+                'tests/data/typical.mp3'))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await task
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel())
@@ -0,0 +1,73 @@
+import math
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+
+from main import RunTelevid
+from televid import Televid
+from televid.classifier import DiffsClassifier
+
+
+class TestDiffsClassifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        results = RunTelevid('tests/data').run(nmultiproc_run=1,
+                                               display_results=False)
+        cls.dataset = [(r.diffs, r.result_type) for r in results]
+        cls.classifier = DiffsClassifier.train(cls.dataset)
+
+    def test_fit_dataset(self):
+        self.assertEqual(self.classifier.predict([d for d, _ in self.dataset]),
+                         [t for _, t in self.dataset])
+
+    def test_batch_proba(self):
+        proba = self.classifier.predict_proba([d for d, _ in self.dataset])
+        self.assertEqual(proba.shape, (len(self.dataset),
+                                       len(self.classifier.classes)))
+        np.testing.assert_allclose(proba.sum(axis=1), 1)
+
+    def test_infinite_and_missing_diffs(self):
+        diffs = dict(self.dataset[0][0])
+        diffs[next(iter(diffs))] = math.inf
+        diffs.pop(sorted(diffs)[-1])
+        proba = self.classifier.predict_proba([diffs])
+        self.assertTrue(np.all(np.isfinite(proba)))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filepath = pathlib.Path(tmpdir, 'classifier.npz')
+            self.classifier.save(filepath)
+            loaded = DiffsClassifier.load(filepath)
+        diffs_list = [d for d, _ in self.dataset]
+        np.testing.assert_allclose(loaded.predict_proba(diffs_list),
+                                   self.classifier.predict_proba(diffs_list))
+        self.assertTrue(loaded.matches(8000, 'mfcc', None))
+
+    def test_settings(self):
+        classifier = DiffsClassifier.train(self.dataset, epochs=1,
+                                           samplerate=None,
+                                           features='mfcc+delta')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            classifier.save(pathlib.Path(tmpdir, 'classifier.npz'))
+            loaded = DiffsClassifier.load_default(tmpdir, None, 'mfcc+delta')
+            self.assertTrue(loaded.matches(None, 'mfcc+delta'))
+            with self.assertLogs('televid.classifier', 'WARNING'):
+                self.assertIsNone(DiffsClassifier.load_default(tmpdir))
+        with self.assertRaises(ValueError):
+            RunTelevid('tests/data').run(classifier=classifier,
+                                         display_results=False)
+
+    def test_televid_result_type(self):
+        televoice = Televid('tests/data/voicemail_b.WAV',
+                            Televid.load_golden_patterns(), self.classifier)
+        televoice.identify()
+        self.assertEqual(televoice.result_type, 'voicemail')
+
+    def test_confident_early_stop(self):
+        televoice = Televid('tests/data/inbusy.mp3',
+                            Televid.load_golden_patterns(), self.classifier)
+        televoice.identify(confidence=0.9)
+        self.assertEqual(televoice.result_type, 'inbusy')
+        self.assertIn('in_busy', televoice.diffs)
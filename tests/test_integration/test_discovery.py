@@ -0,0 +1,61 @@
+import pathlib
+import tempfile
+import unittest
+
+from main import RunTelevid
+from televid.discovery import discover, in_shard, parse_shard
+
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.folder = pathlib.Path(self.tmpdir.name)
+        for name in ('b.wav', 'a.mp3', 'c.txt', 'x/d.wav', 'x/y/e.mp3',
+                     'z/f.WAV'):
+            path = self.folder / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+
+    def relpaths(self, paths):
+        return [p.relative_to(self.folder).as_posix() for p in paths]
+
+    def test_discover(self):
+        self.assertEqual(self.relpaths(discover(self.folder)),
+                         ['a.mp3', 'b.wav', 'x/d.wav', 'x/y/e.mp3'])
+        self.assertEqual(self.relpaths(discover(self.folder, ('*.wav',))),
+                         ['b.wav'])
+        # The other patterns are globbed, without duplicates.
+        self.assertEqual(
+            sorted(self.relpaths(discover(self.folder,
+                                          ('**/*.wav', 'x/*/*.mp3')))),
+            ['b.wav', 'x/d.wav', 'x/y/e.mp3'])
+        self.assertEqual(
+            self.relpaths(discover(self.folder, ('x/*.wav', 'x/d*.wav'))),
+            ['x/d.wav'])
+
+    def test_shard(self):
+        paths = list(discover(self.folder))
+        shards = [[p for p in paths if in_shard(p, (i, 3), self.folder)]
+                  for i in range(3)]
+        self.assertEqual(sorted(p for shard in shards for p in shard),
+                         sorted(paths))
+        # The shard is decided by the relative path only.
+        self.assertEqual(in_shard(self.folder / 'x/d.wav', (1, 3), self.folder),
+                         in_shard('x/d.wav', (1, 3)))
+        self.assertEqual(parse_shard('2/3'), (2, 3))
+        for shard in ('3/3', '-1/3', '1', 'a/b'):
+            with self.assertRaises(ValueError):
+                parse_shard(shard)
+
+    def test_run_shards(self):
+        paths = set()
+        for i in range(2):
+            run = RunTelevid('tests/data', shard=(i, 2))
+            res = run.run(threshold=1500, scan_step=3, nmultiproc_run=4,
+                          display_results=False)
+            paths.update(str(r.filepath) for r in res)
+            self.assertEqual(len(res), len(list(run.paths())))
+        self.assertEqual(
+            paths, {str(p) for p in RunTelevid('tests/data').paths()})
+        self.assertEqual(len(paths), 7)
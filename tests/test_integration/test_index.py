@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from main import RunTelevid
+from televid import Televid
+from televid.index import PatternIndex, embed, embed_windows
+
+
+class TestPatternIndex(unittest.TestCase):
+    expects = {
+        'inbusy.mp3': 'in_busy',
+        'noresponse_a.mp3': 'no_response_A',
+        'noresponse_b.mp3': 'no_response_B',
+        'voicemail_c.mp3': 'voice_mail_C',
+        'voicemail_d_1.mp3': 'voice_mail_D_1',
+        'voicemail_d_2.mp3': 'voice_mail_D_2',
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        cls.golden_patterns = Televid.load_golden_patterns()
+        cls.index = PatternIndex.load_or_build(cls.golden_patterns)
+
+    def test_embed_windows(self):
+        target = np.random.RandomState(0).rand(50, 13)
+        windows = embed_windows(target, 20, step=3)
+        self.assertEqual(len(windows), 11)
+        np.testing.assert_allclose(windows[2], embed(target[6:26]))
+
+    def test_shortlist_contains_match(self):
+        for name, pattern in self.expects.items():
+            televoice = Televid('tests/data/' + name, self.golden_patterns)
+            self.assertIn(pattern, self.index.shortlist(televoice.target_mfcc))
+
+    def test_saved_index(self):
+        self.assertTrue(self.index.matches(self.golden_patterns))
+        loaded = PatternIndex.load_or_build(self.golden_patterns)
+        self.assertEqual(loaded.names, self.index.names)
+        np.testing.assert_allclose(loaded.embeddings, self.index.embeddings)
+
+    def test_run_with_shortlist(self):
+        details = RunTelevid('tests/data').run(nmultiproc_run=1, shortlist=3,
+                                               display_results=False)
+        results = {(r.filepath.name, r.matched_pattern(False), r.result_type)
+                   for r in details}
+        self.assertEqual(results, {
+            (name, pattern.lower(), ''.join(pattern.split('_')[:2]).lower())
+            for name, pattern in self.expects.items()
+        } | {('typical.mp3', 'voice_mail_d_1', 'typical')})
+        self.assertTrue(all(len(r.diffs) == 3 for r in details))
@@ -1,6 +1,12 @@
+import csv
+import pathlib
+import shutil
+import tempfile
 import unittest
 
+import main
 from main import RunTelevid
+from televid.classifier import CLASSIFIER_FILENAME, DiffsClassifier
 
 
 class TestRunTelevid(unittest.TestCase):
@@ -33,3 +39,129 @@ class TestRunTelevid(unittest.TestCase):
         results = {(r.filepath.name, r.matched_pattern(False),
                     r.result_type, r.is_correct) for r in details}
         self.assertEqual(results, self.expects)
+
+    def test_shared_memory(self):
+        details = RunTelevid('tests/data').run(display_results=False,
+                                               shared_memory=True)
+        results = {(r.filepath.name, r.matched_pattern(False),
+                    r.result_type, r.is_correct) for r in details}
+        self.assertEqual(results, self.expects)
+
+    def test_all_channels(self):
+        details = RunTelevid('tests/data').run(threshold=1500, scan_step=3,
+                                               display_results=False,
+                                               all_channels=True)
+        results = {(r.filepath.name, r.channel, r.result_type)
+                   for r in details}
+        self.assertEqual({r for r in results if r[1] == 0},
+                         {(name, 0, result_type)
+                          for name, _, result_type, _ in self.expects})
+        self.assertEqual(len(results), 2 * len(self.expects))
+
+    def test_all_channels_timeout(self):
+        for nmultiproc_run in (1, 4):
+            runner = RunTelevid('tests/data')
+            details = runner.run(display_results=False, all_channels=True,
+                                 timeout=0.5, nmultiproc_run=nmultiproc_run)
+            # Every channel of every file is reported, none is lost with its
+            # terminated worker.
+            self.assertEqual(runner.failures, [])
+            self.assertEqual(len(details), 2 * len(self.expects))
+            # The channels share the time budget of their file.
+            times = dict()
+            for result in details:
+                times[result.filepath] = (times.get(result.filepath, 0)
+                                          + result.identify_time)
+            self.assertLess(max(times.values()), 0.5 + 0.3)
+
+    def test_failures(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shutil.copy('tests/data/inbusy.mp3', tmpdir)
+            pathlib.Path(tmpdir, 'broken.mp3').write_bytes(b'not audio')
+            for nmultiproc_run in (1, 8):
+                batch = RunTelevid(tmpdir)
+                details = batch.run(threshold=1500, scan_step=3,
+                                    nmultiproc_run=nmultiproc_run,
+                                    display_results=False, timeout=30)
+                self.assertEqual([r.result_type for r in details], ['inbusy'])
+                self.assertEqual([pathlib.Path(p).name
+                                  for p, _ in batch.failures], ['broken.mp3'])
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.folder = pathlib.Path(self.tmpdir.name)
+
+    def test_outputs(self):
+        output = self.folder / 'results.csv'
+        self.assertEqual(main.main(['tests/data', '--workers', '4', '-q',
+                                    '--output', str(output)]), main.EXIT_OK)
+        self.assertEqual(len(output.read_text().splitlines()), 8)
+        output = self.folder / 'dataset'
+        self.assertEqual(main.main(['tests/data/*.mp3', 'tests/data/inbusy.mp3',
+                                    '--backend', 'sequential', '-q',
+                                    '--output', str(output), '--resume']),
+                         main.EXIT_OK)
+        self.assertEqual(len(list(output.glob('part-*.npz'))), 1)
+
+    def test_exit_status(self):
+        self.assertEqual(main.main([str(self.folder)]), main.EXIT_NO_INPUTS)
+        pathlib.Path(self.folder, 'broken.mp3').write_bytes(b'not audio')
+        self.assertEqual(main.main([str(self.folder), '--backend', 'shm']),
+                         main.EXIT_FAILURES)
+        for argv in ([str(self.folder / 'missing')], ['--shard', '2/2'],
+                     ['--resume'], ['--backend', 'shm', '--workers', '1'],
+                     ['--classifier', 'c.npz', '--no-classifier']):
+            with self.assertRaises(SystemExit) as ctx:
+                main.main(argv)
+            self.assertEqual(ctx.exception.code, main.EXIT_USAGE)
+
+    def test_cache(self):
+        golden = self.folder / 'golden'
+        golden.mkdir()
+        for name in ('in_busy', 'voice_mail_C'):
+            shutil.copy('televid/wav/%s.wav' % name, str(golden))
+        cache = self.folder / 'cache'
+        self.assertEqual(main.main(['tests/data/inbusy.mp3', '-q',
+                                    '--golden', str(golden),
+                                    '--cache', str(cache),
+                                    '--shortlist', '1']), main.EXIT_OK)
+        self.assertEqual(sorted(p.name for p in golden.iterdir()),
+                         ['in_busy.wav', 'voice_mail_C.wav'])
+        self.assertEqual(sorted(p.name for p in cache.iterdir()),
+                         ['golden_index.npz', 'golden_ptns.pkl'])
+
+    def test_default_classifier(self):
+        golden = self.folder / 'golden'
+        golden.mkdir()
+        for name in ('in_busy', 'voice_mail_C'):
+            shutil.copy('televid/wav/%s.wav' % name, str(golden))
+        DiffsClassifier.train([({'in_busy': 1.0}, 'trained')]).save(
+            golden / CLASSIFIER_FILENAME)
+        output = self.folder / 'results.csv'
+        for argv, expect in (([], 'trained'), (['--no-classifier'], 'inbusy')):
+            self.assertEqual(main.main(['tests/data/inbusy.mp3', '-q',
+                                        '--golden', str(golden),
+                                        '--output', str(output)] + argv),
+                             main.EXIT_OK)
+            with output.open(newline='') as csvfile:
+                row = list(csv.DictReader(csvfile))[0]
+            self.assertEqual(row['Result Type'], expect)
+            output.unlink()
+
+        # It is trained at 8000 Hz with every golden pattern compared.
+        for argv in (['--features', 'mfcc+delta'], ['--shortlist', '1']):
+            self.assertEqual(main.main(['tests/data/inbusy.mp3', '-q',
+                                        '--golden', str(golden),
+                                        '--output', str(output)] + argv),
+                             main.EXIT_OK)
+            with output.open(newline='') as csvfile:
+                row = list(csv.DictReader(csvfile))[0]
+            self.assertEqual(row['Result Type'], 'inbusy')
+            output.unlink()
+        self.assertEqual(main.main(['tests/data/inbusy.mp3', '-q',
+                                    '--samplerate', '16000', '--classifier',
+                                    str(golden / CLASSIFIER_FILENAME)]),
+                         main.EXIT_USAGE)
@@ -0,0 +1,35 @@
+import pathlib
+import pstats
+import tempfile
+import unittest
+
+from main import RunTelevid
+from televid import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.folder = pathlib.Path(self.tmpdir.name)
+
+    def test_profile(self):
+        for nmultiproc_run in (1, 4):
+            output = self.folder / ('run%d.prof' % nmultiproc_run)
+            with profiling.profile(output) as folder:
+                RunTelevid('tests/data').run(threshold=1500, scan_step=3,
+                                             nmultiproc_run=nmultiproc_run,
+                                             display_results=False)
+            self.assertFalse(folder.exists())
+            # Every comparison is counted, including those in the workers.
+            times = profiling.stage_times(pstats.Stats(str(output)))
+            self.assertEqual(times['cmp_proc'][0], 63)
+            self.assertEqual(times['decode'][0], 7)
+            self.assertGreater(times['fbank'][1], 0)
+            summary = output.with_suffix('.txt').read_text()
+            self.assertIn('cmp_proc', summary)
+            self.assertIn('hotspots', summary)
+
+    def test_not_profiling(self):
+        self.assertEqual(profiling.worker(lambda x: x + 1)(1), 2)
+        self.assertEqual(list(self.folder.iterdir()), [])
@@ -0,0 +1,123 @@
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from televid import Televid
+from televid.registry import PatternRegistry
+
+GOLDEN_FOLDER = pathlib.Path('televid/wav')
+
+
+class TestPatternRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.folder = pathlib.Path(self.tmpdir.name)
+        for name in ('in_busy', 'no_response_A'):
+            shutil.copy(str(GOLDEN_FOLDER / (name + '.wav')), str(self.folder))
+        self.registry = PatternRegistry(str(self.folder.resolve()))
+        self.addCleanup(self.registry.stop)
+
+    def test_reload(self):
+        old = self.registry.snapshot()
+        self.assertEqual(set(old), {'in_busy', 'no_response_A'})
+        self.assertFalse(self.registry.reload())
+
+        shutil.copy(str(GOLDEN_FOLDER / 'voice_mail_C.wav'), str(self.folder))
+        shutil.copy(str(GOLDEN_FOLDER / 'no_response_B.wav'),
+                    str(self.folder / 'no_response_A.wav'))
+        self.assertTrue(self.registry.reload())
+        new = self.registry.snapshot()
+        self.assertEqual(set(new), {'in_busy', 'no_response_A', 'voice_mail_C'})
+        self.assertIs(new['in_busy'], old['in_busy'])
+        self.assertEqual(len(new['no_response_A']),
+                         len(Televid.load_golden_patterns()['no_response_B']))
+        # The previous snapshot is untouched.
+        self.assertEqual(set(old), {'in_busy', 'no_response_A'})
+        self.assertEqual(self.registry.version, 1)
+
+        (self.folder / 'in_busy.wav').unlink()
+        self.assertTrue(self.registry.reload())
+        self.assertEqual(set(self.registry.snapshot()),
+                         {'no_response_A', 'voice_mail_C'})
+        # A new registry loads the updated pickle without rebuilding.
+        self.assertEqual(PatternRegistry(str(self.folder.resolve())).version,
+                         0)
+
+    def test_min_interval(self):
+        shutil.copy(str(GOLDEN_FOLDER / 'voice_mail_C.wav'), str(self.folder))
+        self.assertTrue(self.registry.reload(min_interval=0))
+        (self.folder / 'voice_mail_C.wav').unlink()
+        # Checked just now, so the removal is not seen yet.
+        self.assertFalse(self.registry.reload(min_interval=60))
+        self.assertIn('voice_mail_C', self.registry.snapshot())
+        self.assertTrue(self.registry.reload())
+
+    def test_cachepath(self):
+        cache = self.folder / 'cache'
+        registry = PatternRegistry(str(self.folder.resolve()),
+                                   cachepath=str(cache.resolve()))
+        shutil.copy(str(GOLDEN_FOLDER / 'voice_mail_C.wav'), str(self.folder))
+        self.assertTrue(registry.reload())
+        self.assertEqual([p.name for p in cache.iterdir()],
+                         ['golden_ptns.pkl'])
+        self.assertEqual(set(Televid.load_golden_patterns(
+            str(self.folder.resolve()), cachepath=str(cache.resolve()))),
+                         {'in_busy', 'no_response_A', 'voice_mail_C'})
+
+        # The cache cannot be written, but the reload still takes effect.
+        cache.joinpath('golden_ptns.pkl').unlink()
+        cache.rmdir()
+        cache.write_bytes(b'')
+        (self.folder / 'voice_mail_C.wav').unlink()
+        with self.assertLogs('televid.registry', 'WARNING'):
+            self.assertTrue(registry.reload())
+        self.assertNotIn('voice_mail_C', registry.snapshot())
+
+    def test_watch(self):
+        self.registry.watch(interval=0.05)
+        shutil.copy(str(GOLDEN_FOLDER / 'voice_mail_C.wav'), str(self.folder))
+        deadline = time.time() + 10
+        while 'voice_mail_C' not in self.registry.snapshot():
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.05)
+
+    def test_identify(self):
+        televoice = Televid('tests/data/inbusy.mp3', self.registry)
+        televoice.identify()
+        self.assertEqual(set(televoice.diffs), {'in_busy', 'no_response_A'})
+        self.assertEqual(televoice.result_type, 'inbusy')
+        shutil.copy(str(GOLDEN_FOLDER / 'voice_mail_C.wav'), str(self.folder))
+        self.registry.reload()
+        televoice.identify(multiproc=True)
+        self.assertIn('voice_mail_C', televoice.diffs)
+        self.assertTrue(np.isfinite(televoice.diffs['voice_mail_C']))
+
+    def test_concurrent_save(self):
+        # The registries of several workers save on the same change at once.
+        registries = [PatternRegistry(str(self.folder.resolve()))
+                      for _ in range(4)]
+        errors = []
+
+        def save(registry):
+            try:
+                for _ in range(20):
+                    registry._save(registry.snapshot())
+            except OSError as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=save, args=(r,))
+                   for r in registries]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(list(self.folder.glob('*.tmp')), [])
+        self.assertEqual(set(Televid.load_golden_patterns(
+            str(self.folder.resolve()))), {'in_busy', 'no_response_A'})
@@ -0,0 +1,127 @@
+import http.client
+import json
+import os
+import pathlib
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from server import TelevidServer
+
+
+def reject(constant):
+    raise ValueError('Invalid JSON constant %s' % constant)
+
+
+class TestTelevidServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = TelevidServer(('127.0.0.1', 0), workers=2,
+                                   batch_wait=0.2)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+        cls.url = 'http://%s:%d' % cls.server.server_address
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def request(self, path, data=None, content_type=None):
+        req = urllib.request.Request(self.url + path, data=data)
+        if content_type:
+            req.add_header('Content-Type', content_type)
+        with urllib.request.urlopen(req) as res:
+            return json.loads(res.read().decode(), parse_constant=reject)
+
+    def test_health(self):
+        self.assertEqual(self.request('/health'), {'status': 'ok'})
+
+    def test_classify_path(self):
+        output = self.request('/classify?threshold=1500&scan_step=3',
+                              json.dumps({'path': 'tests/data/inbusy.mp3'})
+                              .encode(), 'application/json')
+        self.assertEqual(output['result_type'], 'inbusy')
+        self.assertEqual(output['name'], 'inbusy.mp3')
+        # The comparisons stopped by the threshold are null.
+        self.assertIn(None, output['diffs'].values())
+
+    def test_classify_upload(self):
+        content = pathlib.Path('tests/data/noresponse_b.mp3').read_bytes()
+        output = self.request('/classify?threshold=1500&scan_step=3', content,
+                              'application/octet-stream')
+        self.assertEqual(output['result_type'], 'noresponse')
+
+    def test_concurrent_requests_are_batched(self):
+        names = ['voicemail_c.mp3', 'voicemail_d_1.mp3', 'voicemail_d_2.mp3',
+                 'inbusy.mp3']
+        outputs = [None] * len(names)
+
+        def classify(idx):
+            outputs[idx] = self.request(
+                '/classify?threshold=1500&scan_step=3',
+                json.dumps({'path': 'tests/data/' + names[idx]}).encode(),
+                'application/json')
+
+        threads = [threading.Thread(target=classify, args=(i,))
+                   for i in range(len(names))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([o['result_type'] for o in outputs],
+                         ['voicemail'] * 3 + ['inbusy'])
+        metrics = self.request('/metrics')
+        self.assertLess(metrics['batches'], metrics['requests'])
+        # The batch is spread over both workers.
+        self.assertGreater(metrics['tasks'], metrics['batches'])
+
+    def test_missing_file(self):
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.request('/classify', json.dumps({'path': 'no.wav'}).encode(),
+                         'application/json')
+        self.assertEqual(ctx.exception.code, 422)
+
+    def test_bad_requests(self):
+        errors = self.request('/metrics')['errors']
+        for body in (b'[1]', b'"x"', b'{"path"', b'{}'):
+            with self.assertRaises(urllib.error.HTTPError) as ctx:
+                self.request('/classify', body,
+                             'application/json; charset=utf-8')
+            self.assertEqual(ctx.exception.code, 400)
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        self.addCleanup(conn.close)
+        conn.putrequest('POST', '/classify')
+        conn.putheader('Content-Length', 'abc')
+        conn.endheaders()
+        self.assertEqual(conn.getresponse().status, 400)
+        self.assertEqual(self.request('/metrics')['errors'], errors + 5)
+
+
+class TestBrokenPool(unittest.TestCase):
+    def test_health(self):
+        server = TelevidServer(('127.0.0.1', 0), workers=1)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        url = 'http://%s:%d' % server.server_address
+        with urllib.request.urlopen(url + '/health') as res:
+            self.assertEqual(res.status, 200)
+
+        # A worker dies, which breaks the whole pool.
+        with self.assertRaises(Exception):
+            server.pool.submit(os._exit, 1).result()
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            urllib.request.urlopen(url + '/health')
+        self.assertEqual(ctx.exception.code, 503)
+        # The requests fail instead of hanging.
+        req = urllib.request.Request(
+            url + '/classify', json.dumps({'path': 'a.wav'}).encode(),
+            {'Content-Type': 'application/json'})
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            urllib.request.urlopen(req, timeout=30)
+        self.assertEqual(ctx.exception.code, 422)
@@ -0,0 +1,48 @@
+import pickle
+import unittest
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from televid import Televid
+from televid.shm import SharedArrays, share_patterns, transfer
+
+
+class TestSharedArrays(unittest.TestCase):
+    def test_handles(self):
+        arrays = [np.random.rand(500, 13), np.arange(7)]
+        with SharedArrays(arrays) as block:
+            for array, view in zip(arrays, block.arrays):
+                data = pickle.dumps(view)
+                self.assertLess(len(data), 200)
+                np.testing.assert_array_equal(pickle.loads(data), array)
+            # The arrays derived from a view are sent as they are.
+            derived = pickle.loads(pickle.dumps(block.arrays[0][1:] * 2))
+            np.testing.assert_array_equal(derived, arrays[0][1:] * 2)
+            name = block.name
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name)
+
+    def test_transfer(self):
+        array = np.random.rand(300, 13)
+        sent = transfer(array)
+        name = sent.handle.name
+        received = pickle.loads(pickle.dumps(sent))
+        np.testing.assert_array_equal(received, array)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name)
+
+    def test_share_patterns(self):
+        golden_patterns = Televid.load_golden_patterns()
+        block, shared = share_patterns(golden_patterns)
+        self.addCleanup(block.close)
+        self.assertEqual(shared.samplerate, golden_patterns.samplerate)
+        self.assertEqual(set(shared), set(golden_patterns))
+
+    def test_identify(self):
+        golden_patterns = Televid.load_golden_patterns()
+        expect = Televid('tests/data/inbusy.mp3', golden_patterns)
+        expect.identify(multiproc=True)
+        televoice = Televid('tests/data/inbusy.mp3', golden_patterns)
+        televoice.identify(multiproc=True, shared_memory=True)
+        self.assertEqual(televoice.diffs, expect.diffs)
@@ -0,0 +1,45 @@
+import subprocess
+import sys
+import unittest
+
+
+class TestStartup(unittest.TestCase):
+    # The budget in seconds of `import televid` excluding NumPy, which is
+    # required anyway. Importing SciPy, FFmpeg-Python and multiprocessing
+    # eagerly costs several times of this.
+    budget = 0.15
+
+    @staticmethod
+    def importtime(statement):
+        """ Get the cumulative import time in seconds of each top-level module
+            by `python -X importtime`.
+        """
+
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                               statement], stderr=subprocess.PIPE, check=True,
+                              universal_newlines=True)
+        times = dict()
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            if not name.startswith('  '):
+                times[name.strip()] = int(cumulative) / 1e6
+        return times
+
+    def test_heavy_modules_are_lazy(self):
+        proc = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, televid; print(" ".join(sorted(m for m in '
+             '("scipy", "ffmpeg", "multiprocessing") if m in sys.modules)))'],
+            stdout=subprocess.PIPE, check=True, universal_newlines=True)
+        self.assertEqual(proc.stdout.strip(), '')
+
+    def test_import_budget(self):
+        # Take the best of several runs to ignore the noise of a busy machine.
+        elapsed = min(self._import_televid() for _ in range(3))
+        self.assertLess(elapsed, self.budget)
+
+    def _import_televid(self):
+        times = self.importtime('import numpy; import televid')
+        return times['televid']
@@ -1,7 +1,14 @@
 import logging
+import pathlib
+import tempfile
 import unittest
 
-from televid import Televid
+import ffmpeg
+import numpy as np
+
+from televid import Televid, decode
+from televid.python_speech_features import delta
+from televid.televid import UNKNOWN_TYPE
 
 
 class TestClassificationResult(unittest.TestCase):
@@ -88,3 +95,138 @@ class TestMultiprocessing(unittest.TestCase):
                              Televid.load_golden_patterns())
         classifier.identify(multiproc=True)
         self.assertIsNotNone(classifier.result_type)
+
+
+class TestMultiChannel(unittest.TestCase):
+    def test_channels(self):
+        golden_patterns = Televid.load_golden_patterns()
+        televoices = Televid.from_channels('tests/data/inbusy.mp3',
+                                           golden_patterns)
+        self.assertEqual([t.channel for t in televoices], [0, 1])
+        mono = Televid('tests/data/inbusy.mp3', golden_patterns)
+        np.testing.assert_allclose(televoices[0].target_mfcc, mono.target_mfcc)
+
+    def test_identify_channels(self):
+        televoices = Televid.from_channels('tests/data/noresponse_a.mp3',
+                                           Televid.load_golden_patterns())
+        Televid.identify_channels(televoices, threshold=1500, scan_step=3)
+        self.assertEqual([t.result_type for t in televoices],
+                         ['noresponse', 'typical'])
+        self.assertTrue(all(t.identify_time is not None for t in televoices))
+
+
+class TestLocalization(unittest.TestCase):
+    def test_offsets(self):
+        golden_patterns = Televid.load_golden_patterns()
+        televoice = Televid('tests/data/inbusy.mp3', golden_patterns)
+        televoice.identify(scan_step=2, curves=True)
+        name = min(televoice.diffs, key=televoice.diffs.get)
+        top = televoice.top_offsets(k=3)
+        self.assertEqual(top[0], (televoice.offsets[name],
+                                  televoice.diffs[name]))
+        self.assertEqual([d for _, d in top], sorted(d for _, d in top))
+        start, end = televoice.match_region()
+        self.assertAlmostEqual(end - start, televoice.durations[name])
+
+        parallel = Televid('tests/data/inbusy.mp3', golden_patterns)
+        parallel.identify(scan_step=2, multiproc=True)
+        self.assertEqual(parallel.offsets, televoice.offsets)
+        self.assertEqual(parallel.curves, {})
+        with self.assertRaises(ValueError):
+            parallel.top_offsets()
+
+    def test_mixed_case_name(self):
+        televoice = Televid('tests/data/voicemail_c.mp3',
+                            Televid.load_golden_patterns())
+        televoice.identify(threshold=1500, scan_step=3)
+        self.assertEqual(televoice.matched_pattern(), 'voice_mail_c')
+        self.assertIsNotNone(televoice.match_region())
+        self.assertEqual(televoice.match_region(),
+                         televoice.match_region('voice_mail_C'))
+
+
+class TestCancellation(unittest.TestCase):
+    def test_timeout(self):
+        golden_patterns = Televid.load_golden_patterns()
+        for multiproc in (False, True):
+            televoice = Televid('tests/data/typical.mp3', golden_patterns)
+            televoice.identify(multiproc=multiproc, timeout=0.3)
+            self.assertTrue(televoice.timed_out)
+            self.assertLess(televoice.identify_time, 2)
+            self.assertTrue(any(np.isfinite(d)
+                                for d in televoice.diffs.values()))
+
+    def test_no_result(self):
+        golden_patterns = Televid.load_golden_patterns()
+        televoice = Televid('tests/data/typical.mp3', golden_patterns)
+        televoice.identify(timeout=0)
+        self.assertTrue(televoice.timed_out)
+        self.assertFalse(televoice.has_result)
+        self.assertEqual(televoice.result_type, UNKNOWN_TYPE)
+        self.assertEqual(televoice.matched_pattern(True), (None, np.inf))
+        self.assertIsNone(televoice.match_region())
+        # A channel whose worker is terminated has no difference at all.
+        televoice.diffs.clear()
+        self.assertEqual(televoice.result_type, UNKNOWN_TYPE)
+        self.assertIsNone(televoice.matched_pattern())
+
+    def test_child_error(self):
+        golden_patterns = dict(Televid.load_golden_patterns())
+        golden_patterns['broken'] = np.zeros((10, 5))
+        televoice = Televid('tests/data/inbusy.mp3', golden_patterns)
+        with self.assertRaises(RuntimeError):
+            televoice.identify(multiproc=True)
+
+    def test_decode_timeout(self):
+        with self.assertRaises(TimeoutError):
+            decode('tests/data/typical.mp3', timeout=0)
+
+
+class TestSampleRate(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.wideband = str(pathlib.Path(self.tmpdir.name, 'inbusy.wav'))
+        (ffmpeg.input('tests/data/inbusy.mp3')
+         .output(self.wideband, ar=16000).run(quiet=True))
+
+    def test_native_rate(self):
+        golden_patterns = Televid.load_golden_patterns_per_rate()
+        self.assertEqual(golden_patterns[16000].samplerate, 16000)
+        televoice = Televid(self.wideband, golden_patterns, samplerate=None)
+        televoice.identify(threshold=1500, scan_step=3)
+        self.assertEqual(televoice.samplerate, 16000)
+        self.assertEqual(televoice.result_type, 'inbusy')
+
+    def test_rate_mismatch(self):
+        with self.assertRaises(ValueError):
+            Televid(self.wideband, Televid.load_golden_patterns(),
+                    samplerate=16000)
+
+
+class TestDeltaFeatures(unittest.TestCase):
+    def test_delta(self):
+        feat = np.random.RandomState(0).randn(2, 50, 13)
+        denominator = 2 * sum(n ** 2 for n in range(1, 3))
+        padded = np.pad(feat[1], ((2, 2), (0, 0)), mode='edge')
+        expect = np.array([np.dot(np.arange(-2, 3), padded[t:t + 5])
+                           for t in range(50)]) / denominator
+        np.testing.assert_allclose(delta(feat, 2)[1], expect)
+        np.testing.assert_allclose(delta(feat[1], 2), expect)
+
+    def test_identify(self):
+        golden_patterns = Televid.load_golden_patterns(features='mfcc+delta')
+        self.assertEqual(golden_patterns.features, 'mfcc+delta')
+        for name, pattern in Televid.load_golden_patterns().items():
+            self.assertEqual(golden_patterns[name].shape,
+                             (len(pattern), 26))
+            np.testing.assert_allclose(golden_patterns[name][:, :13],
+                                       pattern)
+        for path, expect in (('inbusy.mp3', 'inbusy'),
+                             ('voicemail_d_2.mp3', 'voicemail')):
+            televoice = Televid('tests/data/' + path, golden_patterns)
+            self.assertEqual(televoice.target_mfcc.shape[1], 26)
+            televoice.identify(threshold=1500, scan_step=3)
+            self.assertEqual(televoice.result_type, expect)
+        with self.assertRaises(ValueError):
+            Televid.load_golden_patterns(features='delta')
@@ -0,0 +1,149 @@
+import csv
+import json
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+
+from main import RunTelevid
+from televid import Televid
+from televid.writers import (CSV_HEADER, CsvResultWriter, JsonlDatasetWriter,
+                             NpzDatasetWriter, load_dataset, merge_outputs)
+
+
+class TestStreamWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.folder = pathlib.Path(self.tmpdir.name)
+
+    def run_batch(self, resume):
+        writers = (CsvResultWriter(self.folder / 'results.csv', resume),
+                   JsonlDatasetWriter(self.folder / 'dataset.jsonl', resume),
+                   NpzDatasetWriter(self.folder / 'dataset', resume))
+        res = RunTelevid('tests/data').run(threshold=1500, scan_step=3,
+                                           nmultiproc_run=1,
+                                           display_results=False,
+                                           writers=writers)
+        for writer in writers:
+            writer.close()
+        return res
+
+    def test_write_and_resume(self):
+        res = self.run_batch(resume=False)
+        self.assertEqual(len(res), 7)
+        for writer_cls, path in ((CsvResultWriter, 'results.csv'),
+                                 (JsonlDatasetWriter, 'dataset.jsonl'),
+                                 (NpzDatasetWriter, 'dataset')):
+            writer = writer_cls(self.folder / path, resume=True)
+            writer.close()
+            self.assertEqual(writer.written,
+                             {(str(r.filepath), None) for r in res})
+        expects = sorted((r.result_type for r in res))
+        for path in ('dataset.jsonl', 'dataset'):
+            dataset = load_dataset(self.folder / path)
+            self.assertEqual(sorted(t for _, t in dataset), expects)
+
+        # Every file is already written, so nothing is identified again.
+        self.assertEqual(self.run_batch(resume=True), set())
+        with (self.folder / 'results.csv').open() as csvfile:
+            self.assertEqual(len(csvfile.readlines()), 8)
+
+    def test_timed_out(self):
+        televoice = Televid('tests/data/typical.mp3',
+                            Televid.load_golden_patterns())
+        televoice.identify(timeout=0)
+        with CsvResultWriter(self.folder / 'results.csv') as writer:
+            writer.write(televoice)
+        with (self.folder / 'results.csv').open(newline='') as csvfile:
+            row = list(csv.reader(csvfile))[1]
+        self.assertEqual(row[CSV_HEADER.index('Result Type')], 'unknown')
+        self.assertEqual(row[CSV_HEADER.index('Timed Out')], 'True')
+        with JsonlDatasetWriter(self.folder / 'dataset.jsonl') as writer:
+            writer.write(televoice)
+        self.assertTrue(json.loads(
+            (self.folder / 'dataset.jsonl').read_text())['timed_out'])
+        with NpzDatasetWriter(self.folder / 'dataset') as writer:
+            writer.write(televoice)
+        with np.load(str(self.folder / 'dataset' / 'part-00000.npz')) as npz:
+            self.assertEqual(npz['timed_out'].tolist(), [True])
+
+    def test_non_finite_diffs(self):
+        televoice = Televid('tests/data/typical.mp3',
+                            Televid.load_golden_patterns())
+        televoice.identify(timeout=0)
+        self.assertTrue(televoice.diffs)
+        path = self.folder / 'dataset.jsonl'
+        with JsonlDatasetWriter(path) as writer:
+            writer.write(televoice)
+
+        def reject(constant):
+            raise ValueError(constant)
+        record = json.loads(path.read_text(), parse_constant=reject)
+        self.assertEqual(set(record['diffs'].values()), {None})
+        (diffs, _), = load_dataset(path)
+        self.assertEqual(diffs, televoice.diffs)
+
+    def test_resume_after_partial_line(self):
+        path = self.folder / 'dataset.jsonl'
+        path.write_text('{"path": "a.wav", "diffs": {}, "result_type": "x"}\n'
+                        '{"path": "b.wav", "dif')
+        writer = JsonlDatasetWriter(path, resume=True)
+        writer.close()
+        self.assertEqual(writer.written, {('a.wav', None)})
+        self.assertEqual(path.read_text().count('\n'), 1)
+
+    def test_resume_channels(self):
+        path = self.folder / 'results.csv'
+        televoices = Televid.from_channels('tests/data/inbusy.mp3',
+                                           Televid.load_golden_patterns())
+        Televid.identify_channels(televoices[:1], threshold=1500, scan_step=3)
+        with CsvResultWriter(path) as writer:
+            writer.write(televoices[0])
+
+        # The folder given as absolute path, and channel 1 is not written.
+        folder = pathlib.Path('tests/data').resolve()
+        with CsvResultWriter(path, resume=True) as writer:
+            res = RunTelevid(str(folder), ('inbusy.mp3',)).run(
+                threshold=1500, scan_step=3, nmultiproc_run=1,
+                display_results=False, writers=(writer,), all_channels=True)
+        self.assertEqual([r.channel for r in res], [1])
+        self.assertEqual(writer.written,
+                         {('tests/data/inbusy.mp3', 0),
+                          (str(folder / 'inbusy.mp3'), 1)})
+
+        with CsvResultWriter(path, resume=True) as writer:
+            for folderpath in ('./tests/data', str(folder)):
+                for nmultiproc_run in (1, 2):
+                    self.assertEqual(RunTelevid(folderpath, ('inbusy.mp3',))
+                                     .run(threshold=1500, scan_step=3,
+                                          nmultiproc_run=nmultiproc_run,
+                                          display_results=False,
+                                          writers=(writer,),
+                                          all_channels=True), set())
+
+    def test_merge(self):
+        for i in range(2):
+            writers = (CsvResultWriter(self.folder / ('r%d.csv' % i)),
+                       JsonlDatasetWriter(self.folder / ('d%d.jsonl' % i)),
+                       NpzDatasetWriter(self.folder / ('d%d' % i)))
+            # Overlapping shards, merged without duplicates.
+            RunTelevid('tests/data', shard=(0, 1) if i else (0, 2)).run(
+                threshold=1500, scan_step=3, nmultiproc_run=1,
+                display_results=False, writers=writers, keep_results=False)
+            for writer in writers:
+                writer.close()
+        for fmt, output in (('r%d.csv', 'r.csv'), ('d%d.jsonl', 'd.jsonl'),
+                            ('d%d', 'd')):
+            count = merge_outputs([self.folder / (fmt % i) for i in range(2)],
+                                  self.folder / output)
+            self.assertEqual(count, 7)
+        writer = CsvResultWriter(self.folder / 'r.csv', resume=True)
+        writer.close()
+        self.assertEqual(len(writer.written), 7)
+        for path in ('d.jsonl', 'd'):
+            self.assertEqual(len(load_dataset(self.folder / path)), 7)
+        with self.assertRaises(ValueError):
+            merge_outputs([self.folder / 'r.csv', self.folder / 'd'],
+                          self.folder / 'x.csv')